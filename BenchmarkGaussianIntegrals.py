@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Compare the compiled central pixel fraction kernel in
+`GaussianIntegrals.pyx` with the numpy version in `PSFFraction.py`
+
+Both are timed on the same random offsets, and the largest difference
+between them is reported. The number of OpenMP threads the compiled
+kernel uses is set with the OMP_NUM_THREADS environment variable.
+
+Usage:
+    python BenchmarkGaussianIntegrals.py -N 100000 1000000 10000000
+'''
+
+import argparse
+import time
+import numpy as np
+import pyximport
+pyximport.install(language_level=3)
+
+import GaussianIntegrals
+import PSFFraction
+
+
+def best_time(function, repeat):
+    times = []
+    for i in range(repeat):
+        start = time.time()
+        result = function()
+        times.append(time.time() - start)
+    return min(times), result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-N', '--nsamples', help='Numbers of samples to time',
+            type=int, nargs='+', default=[100000, 1000000, 10000000])
+    parser.add_argument('-f', '--fwhm', help='Psf fwhm (pixels)',
+            type=float, default=1.6)
+    parser.add_argument('-r', '--repeat', help='Best of this many runs',
+            type=int, default=3)
+    args = parser.parse_args()
+
+    print("%10s %12s %12s %8s %10s" % ('samples', 'numpy / s', 'compiled / s',
+        'speedup', 'max diff'))
+    for n in args.nsamples:
+        dx = np.random.random_sample(n) - 0.5
+        dy = np.random.random_sample(n) - 0.5
+
+        numpy_time, expected = best_time(lambda: PSFFraction.central_fraction(
+            args.fwhm, dx, dy), args.repeat)
+        compiled_time, result = best_time(
+                lambda: GaussianIntegrals.pixel_fractions(args.fwhm, dx, dy),
+                args.repeat)
+
+        print("%10d %12.4f %12.4f %8.2f %10.2e" % (n, numpy_time,
+            compiled_time, numpy_time / compiled_time,
+            np.abs(result - expected).max()))
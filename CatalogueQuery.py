@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Column selections from the Besancon and NOMAD catalogue tables
+
+Selections such as
+
+    select(table, '(cl == 5) & (imagnitude > 0)', 'imagnitude')
+
+return the requested columns of the matching rows as numpy arrays, with
+no Python object per row. Several columns come back as a tuple of arrays
+in the order given. The condition has the syntax of `table.where`.
+
+When PyTables can use an index for the condition (see
+`table.will_query_use_indexing`) and the table has at least `IndexRows`
+rows, the matching rows are found through the index with
+`table.get_where_list`, and only those rows are read. Otherwise the
+table is read in blocks of `BlockRows` rows and the condition evaluated
+on each block with numexpr (the engine of PyTables conditions), which is
+faster than `table.read_where` for a scan, as that still collects the
+matching rows in Python. A table of a few blocks is read faster than its
+index is searched, so small tables are always scanned.
+
+`ensure_indexes` gives the selection columns completely sorted indexes,
+creating any which are missing, replacing partial ones and bringing
+indexes left dirty by appended rows up to date. This needs the file open for writing; the
+catalogue parsers open their files read only, so the indexes are made
+once with
+
+    python CatalogueQuery.py BesanconParser/BesanconDatabase.h5
+
+Each query's time and number of rows are logged.
+'''
+
+import argparse
+import logging
+import time
+import numexpr
+import numpy as np
+import tables
+
+logger = logging.getLogger('CatalogueQuery')
+
+# Rows read and tested at a time
+BlockRows = 2 ** 18
+
+# Smallest table which is queried through its indexes
+IndexRows = 16 * BlockRows
+
+# Columns used in the selections
+IndexedColumns = ['cl', 'typ', 'imagnitude', 'vmagnitude']
+
+
+def ensure_indexes(table, columns=IndexedColumns):
+    '''
+    Gives each of `columns` in `table` a completely sorted index. Returns
+    False if the file is read only, so the indexes cannot be changed.
+    '''
+    if table._v_file.mode == 'r':
+        return False
+
+    for name in columns:
+        if name not in table.colnames:
+            continue
+        column = table.cols._f_col(name)
+        if column.is_indexed and not column.index.is_csi:
+            column.remove_index()
+        if not column.is_indexed:
+            logger.info('Indexing {}.{}'.format(table._v_pathname, name))
+            column.create_csindex()
+    table.reindex_dirty()
+    return True
+
+
+def select(table, condition, columns, condvars=None, use_indexes=None):
+    '''
+    Values of `columns` (a name, or a list of names) in the rows of `table`
+    matching `condition`, with any extra variables of the condition in
+    `condvars`. `use_indexes` forces the use of the indexes (True) or a
+    scan (False) rather than choosing by the table size.
+    '''
+    start = time.time()
+    names = [columns] if isinstance(columns, str) else list(columns)
+
+    if use_indexes is None:
+        use_indexes = table.nrows >= IndexRows
+    indexed = (table.will_query_use_indexing(condition, condvars)
+            if use_indexes else frozenset())
+    if indexed:
+        values = _select_indexed(table, condition, names, condvars)
+    else:
+        values = _select_blocks(table, condition, names, condvars)
+
+    logger.info('{}: {:d} rows matching {} in {:.3f} s{}'.format(
+        table._v_pathname, values[0].size, condition, time.time() - start,
+        ' (indexed on {})'.format(', '.join(sorted(indexed)))
+        if indexed else ''))
+    return values[0] if isinstance(columns, str) else tuple(values)
+
+
+def _select_indexed(table, condition, names, condvars):
+    # Rows found through the indexes, read in row order
+    rows = table.get_where_list(condition, condvars, sort=True)
+    if not rows.size:
+        return [np.empty(0, dtype=table.coldtypes[name]) for name in names]
+    matching = table.read_coordinates(rows)
+    return [np.ascontiguousarray(matching[name]) for name in names]
+
+
+def _select_blocks(table, condition, names, condvars):
+    values = [[] for name in names]
+    for first in range(0, table.nrows, BlockRows):
+        block = table.read(first, min(first + BlockRows, table.nrows))
+        variables = dict((name, block[name]) for name in block.dtype.names)
+        variables.update(condvars or {})
+        match = numexpr.evaluate(condition, local_dict=variables)
+        for value, name in zip(values, names):
+            value.append(block[name][match])
+
+    return [np.concatenate(value) if value else np.empty(0,
+        dtype=table.coldtypes[name]) for (value, name) in zip(values, names)]
+
+
+def select_all(nodes, condition, columns, condvars=None, use_indexes=None):
+    '''
+    `select` over several tables, joined in order
+    '''
+    values = [select(table, condition, columns, condvars, use_indexes)
+            for table in nodes]
+    if isinstance(columns, str):
+        return np.concatenate(values)
+    return tuple(np.concatenate(column) for column in zip(*values))
+
+
+def main(args):
+    with tables.open_file(args.filename, 'a') as h5file:
+        for table in h5file.walk_nodes(args.group, classname='Table'):
+            ensure_indexes(table, args.columns)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description='Index the selection '
+            'columns of the catalogue tables')
+    parser.add_argument('filename', help='Catalogue file')
+    parser.add_argument('-g', '--group', help='Group of the tables',
+            default='/fields', required=False)
+    parser.add_argument('-c', '--columns', help='Columns to index',
+            nargs='+', default=IndexedColumns, required=False)
+    main(parser.parse_args())
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+
+'''
+Memory mapped copies of catalogue columns
+
+Reading a field from the NOMAD or Besancon HDF5 files decodes the same
+columns on every run. `ColumnCache.load` exports the selected rows of the
+requested columns of a field table once, as one `.npy` file per column,
+and afterwards maps them with `np.load(mmap_mode='r')`, so a load costs
+almost nothing and processes working on the same field share the pages
+of the operating system's cache. The arrays are read only.
+
+Each column has a JSON sidecar with its dtype, row count, minimum and
+maximum, and the source file with its size, modification time and
+contents hash. A column is exported again when the source file changes:
+the size and time are checked on every load, and the contents are only
+hashed again if they differ, so an untouched source is never read.
+
+The columns live under `.columncache/`, in a directory for each parser,
+table and selection condition, e.g.
+
+    cache = ColumnCache()
+    vmags = cache.load(NOMADFieldsParser, '/fields/field1', 'vmagnitude',
+            'vmagnitude > 0')
+
+The condition is that of `CatalogueQuery.select`. The parser class is
+only opened when a column has to be exported.
+'''
+
+import json
+import logging
+import os
+import tempfile
+import numpy as np
+from CatalogueQuery import select
+from ResultStore import canonical_hash, file_hash
+
+logger = logging.getLogger('ColumnCache')
+
+DefaultPath = '.columncache'
+
+
+def _stamp(filename):
+    info = os.stat(filename)
+    return info.st_size, info.st_mtime
+
+
+def _write_atomic(filename, write):
+    directory = os.path.dirname(filename)
+    handle, tmpname = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(handle, 'wb') as outfile:
+        write(outfile)
+    os.rename(tmpname, filename)
+
+
+class ColumnCache(object):
+    def __init__(self, path=DefaultPath):
+        super(ColumnCache, self).__init__()
+        self.path = path
+
+    def directory(self, parser, table, condition=None):
+        '''
+        Directory of the columns of `table` selected by `condition`
+        '''
+        return os.path.join(self.path, canonical_hash(parser.__name__, table,
+            condition))
+
+    def _meta_filename(self, directory, name):
+        return os.path.join(directory, name + '.json')
+
+    def _column_filename(self, directory, name):
+        return os.path.join(directory, name + '.npy')
+
+    def metadata(self, parser, table, name, condition=None):
+        '''
+        The sidecar of column `name`, or None if it has not been exported
+        '''
+        filename = self._meta_filename(self.directory(parser, table,
+            condition), name)
+        try:
+            with open(filename) as infile:
+                return json.load(infile)
+        except (IOError, ValueError):
+            return None
+
+    def _is_current(self, directory, name, hashes):
+        # Whether the column is exported and its source is unchanged
+        meta_filename = self._meta_filename(directory, name)
+        try:
+            with open(meta_filename) as infile:
+                meta = json.load(infile)
+            stamp = _stamp(meta['source'])
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+        if not os.path.isfile(self._column_filename(directory, name)):
+            return False
+        if [meta['source_size'], meta['source_mtime']] == list(stamp):
+            return True
+
+        # Touched but maybe not changed: compare the contents, and keep
+        # the new stamp if they are the same
+        source = meta['source']
+        if source not in hashes:
+            hashes[source] = file_hash(source)
+        if hashes[source] != meta['source_hash']:
+            return False
+        meta['source_size'], meta['source_mtime'] = stamp
+        self._write_meta(meta_filename, meta)
+        return True
+
+    def _write_meta(self, filename, meta):
+        _write_atomic(filename, lambda outfile: outfile.write(
+            json.dumps(meta, indent=2, sort_keys=True).encode('utf-8')))
+
+    def _export(self, directory, node, names, condition):
+        source = os.path.abspath(node._v_file.filename)
+        stamp = _stamp(source)
+        source_hash = file_hash(source)
+
+        if condition is None:
+            values = [node.col(name) for name in names]
+        else:
+            values = list(select(node, condition, names))
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for name, value in zip(names, values):
+            logger.info('Exporting {}:{}.{} to {}'.format(source,
+                node._v_pathname, name, directory))
+            _write_atomic(self._column_filename(directory, name),
+                    lambda outfile: np.save(outfile, value))
+            self._write_meta(self._meta_filename(directory, name), {
+                'column': name,
+                'dtype': value.dtype.str,
+                'nrows': int(value.size),
+                'min': float(np.nanmin(value)) if value.size else None,
+                'max': float(np.nanmax(value)) if value.size else None,
+                'table': node._v_pathname,
+                'condition': condition,
+                'source': source,
+                'source_hash': source_hash,
+                'source_size': stamp[0],
+                'source_mtime': stamp[1],
+                })
+
+    def _update(self, parser, table, names, condition):
+        # Exports any of the columns which are missing or stale, and
+        # returns their directory
+        directory = self.directory(parser, table, condition)
+
+        hashes = {}
+        stale = [name for name in names if not self._is_current(directory,
+            name, hashes)]
+        if stale:
+            catalogue = parser()
+            try:
+                where, name = table.rsplit('/', 1)
+                self._export(directory, catalogue.getTable(where or '/',
+                    name), stale, condition)
+            finally:
+                catalogue.close()
+        return directory
+
+    def load(self, parser, table, columns, condition=None):
+        '''
+        Read only, memory mapped values of `columns` (a name, or a list of
+        names) in the rows of `table` matching `condition`, exporting them
+        first with a `parser` (a catalogue parser class, e.g.
+        `NOMADFieldsParser`) if they are missing or stale
+        '''
+        names = [columns] if isinstance(columns, str) else list(columns)
+        directory = self._update(parser, table, names, condition)
+        values = [np.load(self._column_filename(directory, name),
+            mmap_mode='r') for name in names]
+        return values[0] if isinstance(columns, str) else tuple(values)
+
+    def source_hash(self, parser, table, columns, condition=None):
+        '''
+        Contents hash of the catalogue file that `load` would read the
+        columns from, for keying results derived from them
+        '''
+        names = [columns] if isinstance(columns, str) else list(columns)
+        directory = self._update(parser, table, names, condition)
+        # The columns are current, so all come from the same contents
+        with open(self._meta_filename(directory, names[0])) as infile:
+            return json.load(infile)['source_hash']
+
+
+_default_cache = None
+
+
+def default_cache():
+    '''
+    The cache under `DefaultPath`, shared within a process
+    '''
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ColumnCache()
+    return _default_cache
@@ -3,33 +3,15 @@
 '''
 This file contains the initial assumptions
 passed throughout the analysis
+
+The values come from `Instrument.NGTS` and are only calculated when they
+are first used, so importing this module does not create the detector
+model. New code should take an `Instrument.InstrumentProfile` instead.
 '''
-import logging
-from numpy import pi
-from AstErrors import NGTSDetector
+import Instrument
 
-logging.basicConfig(level=logging.INFO)
+__all__ = sorted(set(Instrument.ConfigNames) - Instrument.DetectorNames)
 
-_detector = NGTSDetector()
 
-Gain = 2.9
-HorizontalSpeed = _detector.horizspeed
-VerticalTime = _detector.verttime
-NAXIS1, NAXIS2 = _detector.ccdsize
-ReadTime = _detector.readTime()
-ReadNoise = 12. # e- per pix
-FWHM = 1.6
-Radius = 1.5 * FWHM # pixels
-Area = pi * Radius**2
-BiasLevelADU = 1300 # ADU
-BiasLevel = BiasLevelADU * Gain
-Digitisation = 16
-ElectronicSatur = ((2**Digitisation - 1)) * Area
-TargetBinTime = 3600.
-FullWellDepth = 107E3
-FieldCentre = [(60., -45.), (180., -45.), (300., -45.)]
-PixScale = 4.97
-SkyLevel = {
-        'dark': 20.,
-        'bright': 150.,
-        }
+def __getattr__(name):
+    return Instrument.config_value(Instrument.NGTS, name, __name__)
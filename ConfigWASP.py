@@ -1,27 +1,13 @@
 '''
 This file contains the initial assumptions
 passed throughout the analysis
+
+The values come from `Instrument.WASP`, see `Config.py`
 '''
-from numpy import pi
-from AstErrors import WASPDetector
+import Instrument
+
+__all__ = sorted(set(Instrument.ConfigNames) - Instrument.DetectorNames)
 
-_detector = WASPDetector()
 
-Gain = 2.71
-HorizontalSpeed = _detector.horizspeed
-VerticalTime = _detector.verttime
-NAXIS1, NAXIS2 = _detector.ccdsize
-ReadTime = _detector.readTime()
-ReadNoise = 3.36 # e- per pix
-FWHM = 1.5
-#Radius = 1.5 * FWHM # pixels
-Radius = 2.5
-Area = pi * Radius**2
-BiasLevelADU = 1042 # ADU
-BiasLevel = BiasLevelADU * Gain
-Digitisation = 16
-ElectronicSatur = ((2**Digitisation - 1)) * Area
-TargetBinTime = 3600.
-FullWellDepth = 80E3
-FieldCentre = [(60., -45.), (180., -45.), (300., -45.)]
-PixScale = 13.7
+def __getattr__(name):
+    return Instrument.config_value(Instrument.WASP, name, __name__)
@@ -16,51 +16,27 @@ import pickle
 import os
 from scipy.interpolate import interp1d
 from NOMADFields import NOMADFieldsParser
-import contextlib
-
-
-@contextlib.contextmanager
-def open_bparser():
-    bp = BesanconParser()
-    yield bp
-    bp.close()
-
-
-@contextlib.contextmanager
-def open_nparser():
-    np = NOMADFieldsParser()
-    yield np
-    np.close()
+from ColumnCache import default_cache
 
 
 def get_nomad_mag_data():
-    with open_nparser() as nparse:
-        nodes = [nparse.getTable('/fields', 'field{:d}'.format(i))
-                for i in range(1, 4)]
-        all_vmags = []
-        for node in nodes:
-            all_vmags.extend([row['vmagnitude'] for row in
-                node.where('(vmagnitude > 7) & (vmagnitude < 15)')])
-
-    all_vmags = np.array(all_vmags)
+    cache = default_cache()
+    all_vmags = np.concatenate([cache.load(NOMADFieldsParser,
+        '/fields/field{:d}'.format(i), 'vmagnitude',
+        '(vmagnitude > 7) & (vmagnitude < 15)') for i in range(1, 4)])
 
     return all_vmags
 
 
 
 def get_besancon_mag_data():
-    with open_bparser() as bp:
-        selection_cut = '''((typ == 4) | (typ == 5) | (typ == 6) | (typ == 7)) & (cl == 5) & (imagnitude + vmi < 15) & (imagnitude + vmi > 7)'''
-        #selection_cut = 'cl != 0'
-        nodes = [bp.getTable('/fields', 'field{:d}'.format(i))
-                for i in range(1, 4)]
-
-        all_vmags = []
-        for node in nodes:
-            all_vmags.extend([sum([row['imagnitude'], row['vmi']])
-                for row in node.where(selection_cut)])
-
-        all_vmags = np.array(all_vmags)
+    selection_cut = '''((typ == 4) | (typ == 5) | (typ == 6) | (typ == 7)) & (cl == 5) & (imagnitude + vmi < 15) & (imagnitude + vmi > 7)'''
+    #selection_cut = 'cl != 0'
+    cache = default_cache()
+    all_vmags = np.concatenate([
+        np.add(*cache.load(BesanconParser, '/fields/field{:d}'.format(i),
+            ['imagnitude', 'vmi'], selection_cut), dtype=float)
+        for i in range(1, 4)])
 
     return all_vmags
 
@@ -2,12 +2,11 @@
 # -*- coding: utf-8 -*-
 
 from numpy import *
-import matplotlib.pyplot as plt
-import pyximport; pyximport.install()
 import argparse
-from scipy.integrate import dblquad
+import logging
 import Config as config
-import tables
+import Instrument
+import PSFTable
 
 def Gaussian2D(y, x, fwhm, offset):
     sigma = fwhm / 2.35
@@ -27,7 +26,7 @@ colours = {
 # Some constants
 
 # Read noise electrons have to be added in quadrature
-ReadNoisePerAperture = config.ReadNoise * sqrt(config.Area) # electrons
+ReadNoisePerAperture = Instrument.NGTS.read_noise_per_aperture # electrons
 Extinction = 0.06 # magnitudes per airmass
 
 r'''
@@ -95,7 +94,94 @@ def Scintillation(t, Airmass):
     return error_value
 
 
+# Fraction of the flux in the central pixel used by the saturation
+# functions, for the NGTS psf centred on the pixel
+CentralPixelFraction = 0.281838
+
+
+def central_pixel_fraction(profile=Instrument.NGTS):
+    '''
+    Typical fraction of the flux in the central pixel for the profile's
+    psf, the median over psf centres spread uniformly across the pixel
+    (see OffsetDistribution.py), from the cached `PSFTable`. This is
+    about 0.25 for NGTS rather than `CentralPixelFraction`, so passing it
+    as `central_fraction` gives later saturation times.
+    '''
+    return PSFTable.default_table().median_central(
+            Instrument.get_profile(profile).fwhm)
+
+
+def saturation_time(mag, skypersecperpix, airmass=1., zp=None,
+        central_fraction=None, max_exptime=inf, profile=Instrument.NGTS):
+    '''
+    Exposure time at which the central pixel reaches the full well depth
+
+    The counts in the central pixel are the bias plus a constant rate of
+    source and sky electrons, so the saturation time is
+
+        t = (FullWellDepth / f - Bias) / (Source + Sky)
+
+    where the rates are per second for the whole aperture. All arguments
+    broadcast against each other. Stars which do not saturate within
+    `max_exptime` return inf, and stars already saturated by the bias
+    return 0. The detector and aperture come from `profile`, an
+    `Instrument.InstrumentProfile` or `Instrument.ProfileStack`, and
+    `central_fraction` defaults to `CentralPixelFraction`.
+    '''
+    if zp is None:
+        zp = ZP(1.)
+    profile = Instrument.get_profile(profile)
+    if central_fraction is None:
+        central_fraction = CentralPixelFraction
+
+    mag, skypersecperpix, airmass, central_fraction = broadcast_arrays(
+            *[asarray(value, dtype=float) for value in
+                [mag, skypersecperpix, airmass, central_fraction]])
+
+    SourcePerSec = 10**((zp - (mag + profile.extinction * airmass)) / 2.5)
+    SkyPerSec = skypersecperpix * profile.area
+    BiasCounts = profile.bias_level * profile.area
+
+    with errstate(divide='ignore'):
+        SaturationTime = ((profile.full_well_depth / central_fraction - BiasCounts)
+                / (SourcePerSec + SkyPerSec))
+
+    SaturationTime = where(SaturationTime < 0, 0., SaturationTime)
+    return where(SaturationTime > max_exptime, inf, SaturationTime)
+
+
+def saturation_magnitude(exptime, skypersecperpix, airmass=1., zp=None,
+        central_fraction=None, profile=Instrument.NGTS):
+    '''
+    Inverse of `saturation_time`, the magnitude which saturates the central
+    pixel in `exptime` seconds. Returns nan where the sky and bias alone
+    saturate the pixel.
+    '''
+    if zp is None:
+        zp = ZP(1.)
+    profile = Instrument.get_profile(profile)
+    if central_fraction is None:
+        central_fraction = CentralPixelFraction
+
+    exptime = asarray(exptime, dtype=float)
+    SourcePerSec = ((profile.full_well_depth / central_fraction -
+        profile.bias_level * profile.area) / exptime -
+        asarray(skypersecperpix, dtype=float) * profile.area)
+
+    with errstate(invalid='ignore', divide='ignore'):
+        mag = (zp - 2.5 * log10(SourcePerSec) -
+                profile.extinction * asarray(airmass))
+    return where(SourcePerSec > 0, mag, nan)
+
+
 def main(args):
+    # Only needed for plotting and rendering, so importing this module
+    # for the saturation functions stays cheap
+    import matplotlib.pyplot as plt
+    import tables
+    import PSF
+    import JitterNoise
+
     Moon = args.skylevel  # options are bright or dark
     AirmassOptions = args.airmasses
 
@@ -123,12 +209,16 @@ def main(args):
         * The integral to infinity of the psf
 
     This is calculated by rastering a psf across a pixel and
-    picking the most common value.
+    picking the median value, for the configured fwhm.
     '''
-    #CentralPixelFraction = dblquad(Gaussian2D, -0.5, 0.5, lambda x: -0.5, lambda x: 0.5, args=(FWHM, (0., 0.)))[0] / \
-            #dblquad(Gaussian2D, -Inf, Inf, lambda x: -Inf, lambda x: Inf, args=(FWHM, (0., 0.)))[0]
-    CentralPixelFraction = 0.281838
-    print("Central pixel fraction: %f"  %  CentralPixelFraction)
+    if args.psf == 'gaussian':
+        CentralFraction = (central_pixel_fraction() if args.median_fraction
+                else CentralPixelFraction)
+    else:
+        CentralFraction = PSF.make_psf(args.psf, config.FWHM,
+                args.moffat_beta, args.psf_supersample).typical_central_fraction()
+    print("PSF: %s" % args.psf)
+    print("Central pixel fraction: %f"  %  CentralFraction)
 
     # science exposure time (equal in log space)
     expTime = 10**linspace(log10(5), log10(3600), 100)
@@ -140,9 +230,36 @@ def main(args):
     # Number of exposures that fit into an hour
     nExposures = config.TargetBinTime / totalFrameTime
 
+    # Fractional flux scatter per exposure from pointing jitter over the
+    # intrapixel response
+    FractionalJitterError = JitterNoise.profile_jitter_noise(Instrument.NGTS,
+            expTime, args.jitter)
+    print("Pointing jitter: %.2f pixels rms" % (Instrument.NGTS.jitter_rms
+        if args.jitter is None else args.jitter))
+
     if args.render:
         outfile = tables.open_file(args.render, 'w')
 
+    # Zero point for a 1s exposure (true zero point)
+    if args.zeropoint:
+        zp = float(args.zeropoint)
+    else:
+        zp = ZP(1.)
+    print("Instrumental zero point: %.5f mag" % zp)
+
+    if args.from_cube:
+        from NoiseCube import NoiseCube
+        cube = NoiseCube(args.from_cube)
+        print("Reading noise contributions from %s" % args.from_cube)
+
+        # The cube has to match the calculation below
+        cube.check(zp=zp, npix=config.Area, extinction=Extinction,
+                height=2400., apsize=0.2, scintillation_method='young',
+                darklevel=args.dark, readtime=config.ReadTime,
+                readnoise=config.ReadNoise,
+                jitter_rms=(Instrument.NGTS.jitter_rms if args.jitter is None
+                    else args.jitter))
+
 
     # Get the sky counts per pixel per second
     SkyPerSecPerPix = config.SkyLevel[Moon.lower()]
@@ -166,13 +283,6 @@ def main(args):
         #                               Source Error
         ###############################################################################
 
-        # Zero point for a 1s exposure (true zero point)
-        if args.zeropoint:
-            zp = float(args.zeropoint)
-        else:
-            zp = ZP(1.)
-        print("Instrumental zero point: %.5f mag" % zp)
-
         # Correct the source magnitude for airmass
         AirmassCorrectedMag = TargetMag + Extinction * Airmass
         print("Airmass corrected magnitude: %.3f" % AirmassCorrectedMag)
@@ -235,13 +345,34 @@ def main(args):
         # Add the errors in quadrature when binning
         ScintillationError = ScintillationErrorPerExposure * sqrt(nExposures)
 
+        ###############################################################################
+        #                               Jitter Error
+        ###############################################################################
+
+        # Also a fraction of the source counts per exposure
+        JitterError = FractionalJitterError * SourceCounts * sqrt(nExposures)
+
 
         ###############################################################################
         #                               Total Error
         ###############################################################################
 
         TotalError = sqrt(SourceError**2 + ReadNoiseError**2 + SkyError**2 + ScintillationError**2
-                + DarkCurrentError ** 2)
+                + DarkCurrentError ** 2 + JitterError ** 2)
+
+        if args.from_cube:
+            # Replace the contributions with the cube slice, which are
+            # already fractional errors
+            contributions = cube.contributions(mag=TargetMag,
+                    exptime=expTime, airmass=Airmass, sky=SkyPerSecPerPix,
+                    bintime=config.TargetBinTime)
+            SourceError, DarkCurrentError, ReadNoiseError, SkyError, \
+                    ScintillationError, JitterError, TotalError = [
+                            contributions.source, contributions.dark,
+                            contributions.read, contributions.sky,
+                            contributions.scintillation, contributions.jitter,
+                            contributions.total]
+            BinnedSourceCounts = ones_like(expTime)
 
 
         ###############################################################################
@@ -254,21 +385,17 @@ def main(args):
         of the total flux (source + sky) reaches the full well depth then the
         central pixel is saturatied
 
-        The 30% is assuming a psf fwhm of 1.5 pixels, and the result is calculated
-        in the variable: CentralPixelFraction
+        The fraction depends on the psf fwhm, and the result is calculated
+        in the variable: CentralFraction
         '''
-        TotalFrameCounts = SourceCounts + SkyCounts + (config.BiasLevel * config.Area)
-
-        # Multiply by the fraction that is in the central pixel
-        FluxInCentralPixel = CentralPixelFraction * TotalFrameCounts
+        SaturatedLevel = float(saturation_time(TargetMag, SkyPerSecPerPix,
+            Airmass, zp, central_fraction=CentralFraction,
+            max_exptime=expTime.max()))
 
-        # Get the exposure times at which the source is saturated
-        SaturatedExpTimes = expTime[FluxInCentralPixel > config.FullWellDepth]
-
-        # Pick the minimum one to find the saturation point
-        SaturatedLevel = SaturatedExpTimes.min()
-
-        print("Saturation in %.2f seconds" % SaturatedLevel)
+        if isinf(SaturatedLevel):
+            print("No saturation within %.2f seconds" % expTime.max())
+        else:
+            print("Saturation in %.2f seconds" % SaturatedLevel)
 
 
         ###############################################################################
@@ -280,6 +407,7 @@ def main(args):
                 'read': 'g',
                 'sky': 'b',
                 'scin': 'c',
+                'jitter': 'y',
                 'total': 'm',
                 }
 
@@ -300,6 +428,9 @@ def main(args):
             ax.plot(expTime, ScintillationError / BinnedSourceCounts, 'c-',
                     ls=line_styles[i], label="Scintillation", 
                     color=colours['scin'])
+            ax.plot(expTime, JitterError / BinnedSourceCounts, 'y-',
+                    ls=line_styles[i], label="Jitter",
+                    color=colours['jitter'])
             ax.plot(expTime, TotalError / BinnedSourceCounts, 'k-',
                     ls=line_styles[i], label="Total", 
                     color=colours['total'])
@@ -314,6 +445,8 @@ def main(args):
                     ls=line_styles[i], color=colours['sky'])
             ax.plot(expTime, ScintillationError / BinnedSourceCounts, 'c-',
                     ls=line_styles[i], color=colours['scin'])
+            ax.plot(expTime, JitterError / BinnedSourceCounts, 'y-',
+                    ls=line_styles[i], color=colours['jitter'])
             ax.plot(expTime, TotalError / BinnedSourceCounts, 'k-',
                     ls=line_styles[i], color=colours['total'])
 
@@ -331,6 +464,7 @@ def main(args):
             outfile.create_array(group, 'sky', SkyError, 'Sky')
             outfile.create_array(group, 'read', ReadNoiseError, 'Read')
             outfile.create_array(group, 'scintillation', ScintillationError, 'Scintillation')
+            outfile.create_array(group, 'jitter', JitterError, 'Jitter')
             outfile.create_array(group, 'total', TotalError, 'Total')
 
     if args.render:
@@ -348,8 +482,12 @@ def main(args):
 
         outfile.close()
 
+    if args.from_cube:
+        cube.close()
+
     # Plot the saturated line
-    ax.axvline(SaturatedLevel, color='k', ls=':')
+    if not isinf(SaturatedLevel):
+        ax.axvline(SaturatedLevel, color='k', ls=':')
 
     # label the graph
     plt.legend(loc='best')
@@ -373,6 +511,7 @@ def main(args):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     import warnings
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", r'.*use PyArray_AsCArray.*')
@@ -399,8 +538,30 @@ if __name__ == '__main__':
                 type=float, required=False, nargs='*', default=[1., 2.])
         parser.add_argument('--ylim', help='Y plot limits', type=float,
                 required=False, default=None, nargs=2)
+        parser.add_argument('--from-cube', help='Read the noise contributions '
+                'from a noise cube built with NoiseCube.py', type=str,
+                required=False, default=None, metavar='FILE')
+        parser.add_argument('--psf', help='Psf for the central pixel '
+                'fraction: gaussian (default), moffat, or a supersampled psf '
+                'image saved with numpy.save', default='gaussian',
+                required=False)
+        parser.add_argument('--moffat-beta', help='Moffat psf beta',
+                type=float, required=False, default=2.5)
+        parser.add_argument('--psf-supersample', help='Subpixels per pixel '
+                'of the psf image', type=int, required=False, default=10)
+        parser.add_argument('--median-fraction', help='With the gaussian '
+                'psf, use the median central pixel fraction over psf offsets '
+                '(about 0.25) rather than the centred value (0.2818)',
+                action='store_true')
+        parser.add_argument('--jitter', help='Pointing jitter rms per axis '
+                'in pixels (default: the NGTS value, 0 until measured)',
+                type=float, required=False, default=None)
         args = parser.parse_args()
 
+        if args.from_cube and args.render:
+            parser.error('--render needs the source counts so cannot be used '
+                    'with --from-cube')
+
 
 
         main(args)
@@ -3,12 +3,14 @@
 
 '''
 Usage:
-    ExptimeOptimisation.py [options] --exp_fits <fits> --hprange <hprange>
+    ExptimeOptimisation.py [options] --hprange <hprange>
 
 Options:
     -h, --help                  Show this help
     -o, --output <output>       Output filename
     -t, --title <title>         Plot title
+    -p, --probability           Expected saturated counts, with 95% bands,
+                                from the saturation probability of each star
 '''
 
 import sys
@@ -16,48 +18,47 @@ import os
 from BesanconParser import BesanconParser
 import numpy as np
 import matplotlib.pyplot as plt
-from contextlib import contextmanager
-from functools import partial
-import pickle
 import tables
 from scipy.interpolate import interp1d
 from docopt import docopt
+from fits import Fits
+from SaturationProbability import SaturationProbability
+from MagnitudeIndex import as_index
+from ColumnCache import default_cache
 
 BASE_DIR = os.path.dirname(__file__)
 
 
-@contextmanager
-def open_parser(cls):
-    parser = cls()
-    yield parser
-    parser.close()
-
-besancon_parser = partial(open_parser, cls=BesanconParser)
-
-
-
 class Application(object):
     def __init__(self, args):
         self.args = args
+        if self.args['--probability']:
+            self.probabilities = [SaturationProbability(skylevel=skylevel)
+                    for skylevel in ['dark', 'bright']]
+        else:
+            self.fits = Fits()
 
 
     def saturated_objects(self, mags, exptime):
-        with open(os.path.join(BASE_DIR, self.args['<fits>'])) as infile:
-            data = pickle.load(infile)
-
-        dark_fit = data['dark']
-        bright_fit = data['bright']
-
-        bright_out, dark_out = [], []
-        for e in exptime:
-            le = np.log10(e)
-            dark_ind = mags < dark_fit(le)
-            bright_ind = mags < bright_fit(le)
-
-            dark_out.append(mags[dark_ind].size)
-            bright_out.append(mags[bright_ind].size)
-
-        return dark_out, bright_out
+        if self.args['--probability']:
+            dark, bright = self.saturation_counts(mags, exptime)
+            return list(dark.expected), list(bright.expected)
+
+        dark_fit = self.fits['dark']
+        bright_fit = self.fits['bright']
+
+        index = as_index(mags)
+        le = np.log10(exptime)
+        return (list(index.brighter(dark_fit(le))),
+                list(index.brighter(bright_fit(le))))
+
+    def saturation_counts(self, mags, exptime):
+        '''
+        Expected saturated counts in dark and bright time, with their 95%
+        confidence bands
+        '''
+        return [probability.counts(mags, exptime)
+                for probability in self.probabilities]
 
     def high_precision_objects(self, mags, exptime):
         with tables.open_file(os.path.join(BASE_DIR, self.args['<hprange>'])) as infile:
@@ -66,18 +67,12 @@ class Application(object):
 
         interp_fn = interp1d(ref_e, crosspoints)
 
-        out_x, out_y = [], []
-        for e in exptime:
-            try:
-                thresh = interp_fn(e)
-            except ValueError:
-                continue
-            else:
-                ind = mags < thresh
-                out_x.append(e)
-                out_y.append(mags[ind].size)
+        # Exposure times outside of the tabulated range are skipped
+        exptime = np.asarray(exptime, dtype=float)
+        out_x = exptime[(exptime >= ref_e.min()) & (exptime <= ref_e.max())]
+        out_y = as_index(mags).brighter(interp_fn(out_x))
 
-        return list(map(np.array, [out_x, out_y]))
+        return [out_x, out_y]
 
 
     def get_shutter_ops(self, exptimes, readout=1.5):
@@ -95,39 +90,48 @@ class Application(object):
         ax_bottom = fig.add_subplot(313, sharex=ax_top)
 
         exptimes = 10 ** np.linspace(np.log10(5), np.log10(50), 100)
-        with besancon_parser() as parser:
-            for i in range(1, 4):
-                # Magnitude data
-                catalogue_table = parser.getTable('/fields', 'field{:d}'.format(i))
-
-
-                # Get the separate magnitude arrays
-                mags_dwarfs = np.array([every['imagnitude'] for every in
-                        catalogue_table.where('''(cl == 5) & (imagnitude > 0)''')])
-                mags_giants = np.array([every['imagnitude'] for every in
-                    catalogue_table.where('''(cl < 5) & (imagnitude > 0)''')])
-
-
-                # Plot the high precision objects
-                hp_exptime, high_precision = self.high_precision_objects(mags_dwarfs, 
-                        exptimes)
-                ax_top.plot(hp_exptime, high_precision, 'k-', color='k')
-
-                # Plot the saturation points
+        cache = default_cache()
+        for i in range(1, 4):
+            # Magnitude data
+            catalogue_table = '/fields/field{:d}'.format(i)
+
+
+            # Get the separate magnitude arrays
+            mags_dwarfs = cache.load(BesanconParser, catalogue_table,
+                    'imagnitude', '(cl == 5) & (imagnitude > 0)')
+            mags_giants = cache.load(BesanconParser, catalogue_table,
+                    'imagnitude', '(cl < 5) & (imagnitude > 0)')
+
+            # Sorted once for all of the counts
+            mags_dwarfs = as_index(mags_dwarfs)
+
+            # Plot the high precision objects
+            hp_exptime, high_precision = self.high_precision_objects(mags_dwarfs, 
+                    exptimes)
+            ax_top.plot(hp_exptime, high_precision, 'k-', color='k')
+
+            # Plot the saturation points
+            if self.args['--probability']:
+                all_counts = self.saturation_counts(mags_dwarfs, exptimes)
+                for counts in all_counts:
+                    ax_bottom.fill_between(exptimes, counts.low,
+                            counts.high, color='k', alpha=0.2, lw=0)
+                dark, bright = [counts.expected for counts in all_counts]
+            else:
                 dark, bright = self.saturated_objects(mags_dwarfs, exptimes)
                 dark, bright = list(map(np.array, [dark, bright]))
 
-                # Prevent the zeros being plotted
-                dark_ind = dark > 0
-                bright_ind = bright > 0
+            # Prevent the zeros being plotted
+            dark_ind = dark > 0
+            bright_ind = bright > 0
 
-                ax_bottom.plot(exptimes[dark_ind], dark[dark_ind], 'k-')
-                ax_bottom.plot(exptimes[bright_ind], bright[bright_ind], 'k--')
+            ax_bottom.plot(exptimes[dark_ind], dark[dark_ind], 'k-')
+            ax_bottom.plot(exptimes[bright_ind], bright[bright_ind], 'k--')
 
 
-                # Calculate the shutter operations
-                shutter_ops = self.get_shutter_ops(exptimes)
-                ax_mid.plot(exptimes, shutter_ops, 'k-')
+            # Calculate the shutter operations
+            shutter_ops = self.get_shutter_ops(exptimes)
+            ax_mid.plot(exptimes, shutter_ops, 'k-')
 
 
         ticks = [5, 10, 20, 50]
@@ -8,15 +8,9 @@ given size as the psf is moved away from the centre pixel
 from numpy import *
 from ppgplot import *
 import argparse
-from multiprocessing import Pool
-from scipy.integrate import *
-from Config import *
-
-def Gaussian2D(y, x, fwhm, offset):
-    sigma = fwhm / 2.35
-    arg1 = (x-offset[0])**2
-    arg2 = (y - offset[1])**2
-    return exp(-(arg1 + arg2) / (2. * sigma**2))
+import logging
+from Config import FWHM
+from PSFFraction import central_fraction
 
 
 def Ratio(fwhm=1.5, offset=(0., 0.)):
@@ -24,8 +18,7 @@ def Ratio(fwhm=1.5, offset=(0., 0.)):
     Returns the ratio between the centre integral
     and full integral of the psf.
     '''
-    return dblquad(Gaussian2D, -0.5, 0.5, lambda x: -0.5, lambda x: 0.5, args=(fwhm, offset))[0] / \
-            dblquad(Gaussian2D, -Inf, Inf, lambda x: -Inf, lambda x: Inf, args=(fwhm, offset))[0] 
+    return central_fraction(fwhm, offset[0], offset[1])
 
 class App(object):
     """docstring for App"""
@@ -38,8 +31,6 @@ class App(object):
 
         pgopen(self.args.device)
 
-        self.totalIntegral = dblquad(Gaussian2D, -Inf, Inf, lambda x: -Inf, lambda x: Inf, args=(self.fwhm, (0., 0.)))[0] 
-
         self.run()
 
     def __del__(self):
@@ -48,23 +39,15 @@ class App(object):
     def run(self):
         pgenv(-0.1, 3., -6, 0, 0, 20)
 
-        y1data = []
-        y2data = []
-        for x in self.xvals:
-            y = 0.
-            ratio = dblquad(Gaussian2D, -0.5, 0.5, lambda x: -0.5, lambda x: 0.5, args=(self.fwhm, (x, y)))[0] / \
-                    self.totalIntegral
-            y1data.append(log10(ratio))
-            y = x
-            ratio = dblquad(Gaussian2D, -0.5, 0.5, lambda x: -0.5, lambda x: 0.5, args=(self.fwhm, (x, y)))[0] / \
-                    self.totalIntegral
-            y2data.append(log10(Ratio(self.fwhm, (x, y))))
+        # Horizontal and diagonal offsets
+        y1data = log10(Ratio(self.fwhm, (self.xvals, 0.)))
+        y2data = log10(Ratio(self.fwhm, (self.xvals, self.xvals)))
 
         pgsls(1)
-        pgline(self.xvals, array(y1data))
+        pgline(self.xvals, y1data)
         pgline(array([2.0, 2.1]), log10([0.3, 0.3]))
         pgsls(2)
-        pgline(self.xvals, array(y2data))
+        pgline(self.xvals, y2data)
         pgline(array([2.0, 2.1]), log10([0.15, 0.15]))
         pgsls(1)
 
@@ -76,6 +59,7 @@ class App(object):
         
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--device", help="PGPLOT device",
             required=False, type=str, default="1/xs")
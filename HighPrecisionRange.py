@@ -8,35 +8,26 @@ for varying exposure times, using both the
 Besancon model and real field data
 '''
 
-import subprocess as sp
-import os.path
 import numpy as np
-import multiprocessing
 import argparse
+import logging
 
 import pickle
 
-dataScriptName = os.path.join(
-        os.path.dirname(__file__),
-        "TheoryNoiseWithBinning.py"
-        )
+import Instrument
+from fits import Fits
+from TheoryNoiseWithBinning import precision_stats
+from Sweep import SweepExecutor
+from ResultStore import ResultStore
+
 
 def getStatsForExptime(time):
     '''
-    Calls the script which provides the data,
-    and parses the results
+    Returns the 1mmag crossing point and the dark and bright
+    saturation limits for a single exposure time
     '''
-    print("T: %.1f" % time)
-    cmd = ['python', dataScriptName, "-o", "/tmp/output.png", "-e", str(time), "-v"]
-    p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.PIPE)
-    linestr, err = p.communicate()
-    lines = linestr.split("\n")
-
-    crosspoint = float(filter(lambda line: "CROSSPOINT" in line, lines)[0].split()[-1])
-    darkpoint = float(filter(lambda line: "DARK" in line, lines)[0].split()[-1])
-    brightpoint = float(filter(lambda line: 'BRIGHT' in line, lines)[0].split()[-1])
-
-    return crosspoint, darkpoint, brightpoint
+    stats = precision_stats(time)
+    return float(stats.crosspoint), float(stats.darklimit), float(stats.brightlimit)
 
 class App(object):
     """Main application"""
@@ -54,24 +45,39 @@ class App(object):
         @param args @todo
         """
 
-        answer = input("This program generates the data. It takes a while. "
-                "Are you sure you want to run this, and not just plot the data using "
-                "PlotHighPrecisionRange.py? [y/N] ")
-
-        if answer.upper() != "Y":
-            print("Exiting")
-            exit()
+        if not args.yes:
+            answer = input("This program generates the data. It takes a while. "
+                    "Are you sure you want to run this, and not just plot the data using "
+                    "PlotHighPrecisionRange.py? [y/N] ")
 
+            if answer.upper() != "Y":
+                print("Exiting")
+                exit()
 
         self._args = args
 
-        self.pool = multiprocessing.Pool()
+        if args.exptimes:
+            self._exptimes = args.exptimes
+
+        self.executor = SweepExecutor(processes=args.processes)
+
+        # Results are reused until the configuration, noise model or
+        # saturation fits change
+        fits = Fits()
+        self.store = ResultStore('HighPrecisionRange', [
+            Instrument.NGTS.cache_key(), fits['dark'].key,
+            fits['bright'].key])
+        if args.clean:
+            self.store.clear()
 
 
 
 
     def run(self):
-        crosspoints, darkpoints, brightpoints = list(zip(*list(map(getStatsForExptime, self._exptimes))))
+        with self.executor:
+            crosspoints, darkpoints, brightpoints = list(zip(
+                *self.executor.map(getStatsForExptime, self._exptimes,
+                    store=self.store)))
 
         self._exptimes = np.array(self._exptimes)
         self.crosspoints = np.array(crosspoints)
@@ -89,7 +95,7 @@ class App(object):
         '''
         pickle.dump(np.array([self._exptimes, self.crosspoints, self.darkpoints,
             self.brightpoints]),
-                open("precisiondata.cpickle", "w"),
+                open("precisiondata.cpickle", "wb"),
                 protocol=2)
 
 
@@ -100,7 +106,18 @@ class App(object):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser()
+    parser.add_argument('-j', '--processes', help='Number of processes '
+            '(default: number of cores)', type=int, required=False,
+            default=None)
+    parser.add_argument('-e', '--exptimes', help='Exposure times to '
+            'calculate (default: 20 between 1 and 50 seconds)', type=float,
+            nargs='+', required=False, default=None)
+    parser.add_argument('--clean', help='Recompute every exposure time '
+            'rather than reusing stored results', action='store_true')
+    parser.add_argument('-y', '--yes', help='Generate the data without '
+            'asking first', action='store_true')
     args = parser.parse_args()
     app = App(args)
     app.run()
@@ -0,0 +1,332 @@
+# -*- coding: utf-8 -*-
+
+'''
+Instrument profiles
+
+Each profile is an immutable, hashable description of an instrument and
+its site: the detector, the photometry aperture and the noise model
+parameters. The detector readout values (e.g. the read time) are plain
+fields; a profile which leaves one as None takes it from the `AstErrors`
+detector model instead, which is only loaded when such a value is first
+asked for, so importing this module has no side effects, and several
+instruments can be used in the same process.
+
+Variants are made with `_replace`, e.g.
+
+    LowNoise = NGTS._replace(name='NGTS low noise', read_noise=6.)
+
+and `ProfileStack` presents a list of profiles as arrays along a new
+leading axis, so the noise model compares them all in one call:
+
+    profiles = ProfileStack([NGTS, WASP, LowNoise], ndim=1)
+    NoiseModel.profile_noise(profiles, mag, 10., 1.3, 'dark')
+
+returns each contribution with shape (3, mag.size).
+'''
+
+from collections import namedtuple
+import numpy as np
+
+_Fields = [
+        'name',
+        'detector',             # Detector class in AstErrors
+        'read_time',            # frame read time, s
+        'horizontal_speed',     # horizontal readout speed, Hz
+        'vertical_time',        # vertical shift time, s
+        'naxis1',               # pixels
+        'naxis2',
+        'gain',                 # e- per ADU
+        'read_noise',           # e- per pix
+        'fwhm',                 # pixels
+        'radius',               # saturation aperture radius, pixels
+        'bias_level_adu',
+        'digitisation',         # bits
+        'full_well_depth',      # e-
+        'pixscale',             # arcseconds per pixel
+        'field_centres',        # ((ra, dec), ...) in degrees
+        'sky_dark',             # e- per second per pixel
+        'sky_bright',
+        'target_bintime',       # seconds
+        'photometry_radius',    # pixels
+        'extinction',           # magnitudes per airmass
+        'height',               # site altitude, m
+        'apsize',               # telescope aperture, m
+        'zp',                   # zero point for a 1 second exposure
+        'scintillation_method',
+        'jitter_rms',           # pointing jitter per axis, pixels
+        'intrapixel_variation', # sensitivity drop from pixel centre to edge
+        ]
+
+
+_detectors = {}
+
+
+def detector(name):
+    '''
+    Returns the (shared) `AstErrors` detector object called `name`
+    '''
+    if name not in _detectors:
+        import AstErrors
+        _detectors[name] = getattr(AstErrors, name)()
+    return _detectors[name]
+
+
+class InstrumentProfile(namedtuple('InstrumentProfile', _Fields)):
+    '''
+    Frozen instrument description, see the module docstring
+    '''
+    __slots__ = ()
+
+    def _detector_value(self, name, model_value):
+        # The field, or the AstErrors model's value if it is None
+        value = tuple.__getitem__(self, _Fields.index(name))
+        if value is None:
+            value = model_value(detector(self.detector))
+        return value
+
+    @property
+    def read_time(self):
+        return self._detector_value('read_time',
+                lambda model: model.readTime())
+
+    @property
+    def horizontal_speed(self):
+        return self._detector_value('horizontal_speed',
+                lambda model: model.horizspeed)
+
+    @property
+    def vertical_time(self):
+        return self._detector_value('vertical_time',
+                lambda model: model.verttime)
+
+    @property
+    def naxis1(self):
+        return self._detector_value('naxis1',
+                lambda model: model.ccdsize[0])
+
+    @property
+    def naxis2(self):
+        return self._detector_value('naxis2',
+                lambda model: model.ccdsize[1])
+
+    @property
+    def area(self):
+        return np.pi * self.radius ** 2
+
+    @property
+    def npix(self):
+        '''
+        Number of pixels in the photometry aperture
+        '''
+        return np.pi * self.photometry_radius ** 2
+
+    @property
+    def bias_level(self):
+        return self.bias_level_adu * self.gain
+
+    @property
+    def electronic_satur(self):
+        return (2 ** self.digitisation - 1) * self.area
+
+    @property
+    def read_noise_per_aperture(self):
+        # Read noise electrons have to be added in quadrature
+        return self.read_noise * np.sqrt(self.area)
+
+    @property
+    def sky_level(self):
+        return {'dark': self.sky_dark, 'bright': self.sky_bright}
+
+    @property
+    def parameters(self):
+        '''
+        The site and photometry parameters in the form of
+        `NoiseModel.NGTSParameters`
+        '''
+        return {
+                'npix': self.npix,
+                'extinction': self.extinction,
+                'height': self.height,
+                'apsize': self.apsize,
+                'zp': self.zp,
+                }
+
+    def cache_key(self):
+        '''
+        The profile and the values derived from the detector model, for
+        keying stored results
+        '''
+        return [self, self.read_time]
+
+
+NGTS = InstrumentProfile(
+        name='NGTS',
+        detector='NGTSDetector',
+        # The NGTS camera specification at the 3 MHz readout speed, and
+        # the frame read time calculated from it (writeup/ThesisChapter)
+        read_time=1.49,
+        horizontal_speed=3E6,
+        vertical_time=38E-6,
+        naxis1=2048,
+        naxis2=2048,
+        gain=2.9,
+        read_noise=12.,
+        fwhm=1.6,
+        radius=1.5 * 1.6,
+        bias_level_adu=1300,
+        digitisation=16,
+        full_well_depth=107E3,
+        pixscale=4.97,
+        field_centres=((60., -45.), (180., -45.), (300., -45.)),
+        sky_dark=20.,
+        sky_bright=150.,
+        target_bintime=3600.,
+        photometry_radius=3.,
+        extinction=0.06,
+        height=2400.,
+        apsize=0.2,
+        zp=21.1,
+        scintillation_method='osborn',
+        # Not measured yet, so the jitter term is off unless a profile
+        # (e.g. NGTS._replace(jitter_rms=0.1, intrapixel_variation=0.02))
+        # or --jitter turns it on
+        jitter_rms=0.,
+        intrapixel_variation=0.,
+        )
+
+# The WASP data predates the Osborn correction, so stick with Young
+WASP = InstrumentProfile(
+        name='WASP',
+        detector='WASPDetector',
+        # From the AstErrors detector model
+        read_time=None,
+        horizontal_speed=None,
+        vertical_time=None,
+        naxis1=None,
+        naxis2=None,
+        gain=2.71,
+        read_noise=3.36,
+        fwhm=1.5,
+        radius=2.5,
+        bias_level_adu=1042,
+        digitisation=16,
+        full_well_depth=80E3,
+        pixscale=13.7,
+        field_centres=((60., -45.), (180., -45.), (300., -45.)),
+        sky_dark=18.,
+        sky_bright=18.,
+        target_bintime=3600.,
+        photometry_radius=3.5,
+        extinction=0.08,
+        height=2400.,
+        apsize=0.111,
+        zp=18.545,
+        scintillation_method='young',
+        jitter_rms=0.,
+        intrapixel_variation=0.,
+        )
+
+Profiles = {
+        'ngts': NGTS,
+        'wasp': WASP,
+        }
+
+
+def get_profile(profile):
+    '''
+    Returns `profile`, looking it up in `Profiles` if given by name
+    '''
+    if isinstance(profile, str):
+        try:
+            return Profiles[profile.lower()]
+        except KeyError:
+            raise RuntimeError("Unknown instrument: {}".format(profile))
+    return profile
+
+
+# The module level names in `Config.py` and `ConfigWASP.py`, and the
+# profile attributes they come from
+ConfigNames = {
+        'Gain': 'gain',
+        'HorizontalSpeed': 'horizontal_speed',
+        'VerticalTime': 'vertical_time',
+        'NAXIS1': 'naxis1',
+        'NAXIS2': 'naxis2',
+        'ReadTime': 'read_time',
+        'ReadNoise': 'read_noise',
+        'FWHM': 'fwhm',
+        'Radius': 'radius',
+        'Area': 'area',
+        'BiasLevelADU': 'bias_level_adu',
+        'BiasLevel': 'bias_level',
+        'Digitisation': 'digitisation',
+        'ElectronicSatur': 'electronic_satur',
+        'TargetBinTime': 'target_bintime',
+        'FullWellDepth': 'full_well_depth',
+        'FieldCentre': 'field_centres',
+        'PixScale': 'pixscale',
+        'SkyLevel': 'sky_level',
+        'JitterRMS': 'jitter_rms',
+        'IntrapixelVariation': 'intrapixel_variation',
+        }
+
+# The names whose values can come from the `AstErrors` detector model.
+# These are left out of `from Config import *`, so the star import never
+# loads it; scripts which need them use the profile, e.g. `NGTS.read_time`.
+DetectorNames = {'HorizontalSpeed', 'VerticalTime', 'NAXIS1', 'NAXIS2',
+        'ReadTime'}
+
+
+def config_value(profile, name, module):
+    '''
+    Returns the `Config.py` style value `name` for `profile`, raising
+    AttributeError for `module` if there is no such value
+    '''
+    try:
+        attribute = ConfigNames[name]
+    except KeyError:
+        raise AttributeError("module {!r} has no attribute {!r}".format(
+            module, name))
+
+    value = getattr(profile, attribute)
+    if attribute == 'field_centres':
+        value = list(value)
+    return value
+
+
+def sky_level(profile, skylevel):
+    '''
+    Sky level in electrons per second per pixel, given by name ("dark" or
+    "bright") or as a value
+    '''
+    if isinstance(skylevel, str):
+        try:
+            return getattr(profile, 'sky_' + skylevel.lower())
+        except AttributeError:
+            raise RuntimeError("Invalid sky type: {}".format(skylevel))
+    return skylevel
+
+
+class ProfileStack(object):
+    '''
+    A sequence of profiles with every field and derived value as an array
+    along a new leading axis, followed by `ndim` length 1 axes so they
+    broadcast against `ndim` dimensional inputs
+    '''
+    def __init__(self, profiles, ndim=0):
+        super(ProfileStack, self).__init__()
+        self.profiles = tuple(get_profile(profile) for profile in profiles)
+        self.ndim = ndim
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def __iter__(self):
+        return iter(self.profiles)
+
+    def __getattr__(self, name):
+        if name.startswith('_') or name in ('profiles', 'ndim'):
+            raise AttributeError(name)
+        values = np.array([getattr(profile, name) for profile in self.profiles])
+        return values.reshape((len(self.profiles),) + values.shape[1:] +
+                (1,) * self.ndim)
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+'''
+Flux scatter from pointing jitter over a non-uniform pixel response
+
+As the psf wanders during an exposure the flux recorded in a fixed
+aperture changes, because the sensitivity varies across each pixel and
+the psf wings move in and out of the aperture. This matters for the
+undersampled NGTS psf. The scatter is found by simulating jitter tracks
+for psf centres spread over the pixel, and is returned as a fractional
+error per exposure, which the noise model bins like scintillation.
+
+The intrapixel sensitivity is separable, p(x) p(y), with
+
+    p(u) = 1 + 4 v (1/12 - u^2)
+
+for u from -1/2 to 1/2 across the pixel, which averages to 1 and falls by
+the `variation` v from the pixel centre to its edge. For a Gaussian psf
+the response of each pixel is then a closed form of error functions and
+exponentials, so every point of every track is evaluated at once.
+
+The jitter along each axis is a Gaussian (Ornstein-Uhlenbeck) process
+with rms `jitter_rms` pixels and correlation time `JitterTimescale`
+about the mean position. The scatter against exposure time comes from one
+simulation for each psf, jitter rms and aperture, kept in the
+`NoiseCache`; any exposure time is then an interpolation along it, so
+the noise model only pays for the simulation once.
+'''
+
+import numpy as np
+from scipy.special import erf
+import Instrument
+import PSFFraction
+from NoiseCache import default_cache
+
+# Correlation time of the pointing jitter (s)
+JitterTimescale = 1.
+
+# Track sampling, and the samples per track. Exposures longer than the
+# track are scaled from its end, as the variance of the mean flux falls as
+# 1 / exptime once the exposure is much longer than the correlation time.
+StepsPerTimescale = 4
+MaxSteps = 256
+
+# Mean psf positions per axis over a quadrant of the pixel (the response
+# is symmetric), and jitter tracks per position
+PositionsPerAxis = 8
+Tracks = 64
+
+
+def pixel_responses(fwhm, offset, halfwidth, variation=0.):
+    '''
+    Fraction of the flux detected in each pixel from -`halfwidth` to
+    `halfwidth` along one axis, for the psf centre `offset` pixels from
+    the centre of the central pixel. The last axis indexes the pixels.
+    '''
+    sigma = np.asarray(fwhm, dtype=float)[..., None] / PSFFraction.FWHMToSigma
+    offset = np.asarray(offset, dtype=float)[..., None]
+
+    # Pixel edges relative to the psf centre, shared by neighbouring pixels
+    edges = np.arange(-halfwidth, halfwidth + 2) - 0.5 - offset
+    density = np.exp(-0.5 * (edges / sigma) ** 2) / (np.sqrt(2. * np.pi) *
+            sigma)
+
+    # Zeroth, first and second moments of the psf over each pixel
+    m0 = np.diff(0.5 * erf(edges / (np.sqrt(2.) * sigma)), axis=-1)
+    m1 = -sigma ** 2 * np.diff(density, axis=-1)
+    m2 = sigma ** 2 * (m0 - np.diff(edges * density, axis=-1))
+
+    # Integral of the psf times p(t + shift) over the pixel, where shift is
+    # the psf centre relative to the pixel centre
+    shift = offset - np.arange(-halfwidth, halfwidth + 1)
+    return ((1. + variation / 3.) * m0 - 4. * variation * (m2 +
+        2. * shift * m1 + shift ** 2 * m0))
+
+
+def _aperture_mask(radius):
+    halfwidth = int(np.ceil(radius))
+    pixels = np.arange(-halfwidth, halfwidth + 1)
+    return halfwidth, (pixels[:, None] ** 2 + pixels[None, :] ** 2 <=
+            radius ** 2).astype(float)
+
+
+def aperture_response(fwhm, dx, dy, radius, variation=0.):
+    '''
+    Fraction of the flux detected in the pixels whose centres are within
+    `radius` pixels of the central pixel centre, for (broadcast) psf
+    offsets `dx`, `dy`
+    '''
+    halfwidth, mask = _aperture_mask(radius)
+    x = pixel_responses(fwhm, dx, halfwidth, variation)
+    y = pixel_responses(fwhm, dy, halfwidth, variation)
+    return (np.dot(x, mask.T) * y).sum(axis=-1)
+
+
+def jitter_tracks(jitter_rms, nsteps, step, ntracks, rng,
+        timescale=JitterTimescale):
+    '''
+    Returns `ntracks` jitter tracks of `nsteps` samples `step` seconds
+    apart, with shape (ntracks, nsteps, 2)
+    '''
+    correlation = np.exp(-step / timescale)
+    innovations = rng.standard_normal((ntracks, nsteps, 2))
+
+    # Start from the stationary distribution
+    tracks = np.empty_like(innovations)
+    tracks[:, 0] = jitter_rms * innovations[:, 0]
+    scale = jitter_rms * np.sqrt(1. - correlation ** 2)
+    for i in range(1, nsteps):
+        tracks[:, i] = correlation * tracks[:, i - 1] + scale * innovations[:, i]
+    return tracks
+
+
+def jitter_curve(fwhm, jitter_rms, radius, variation=0.,
+        timescale=JitterTimescale, seed=0):
+    '''
+    Fractional rms scatter of the aperture flux between exposures of 1 to
+    `MaxSteps` track samples, for psf centres spread uniformly over the
+    pixel. Every exposure time is the mean over the start of the same
+    tracks, so one simulation gives the whole curve. Returns the exposure
+    times and the scatter.
+    '''
+    step = float(timescale) / StepsPerTimescale
+    rng = np.random.default_rng(seed)
+    tracks = jitter_tracks(jitter_rms, MaxSteps, step, Tracks, rng,
+            timescale)
+
+    # Response of each column and row of the aperture along every track,
+    # for each mean position along that axis
+    centres = (np.arange(PositionsPerAxis) + 0.5) * 0.5 / PositionsPerAxis
+    halfwidth, mask = _aperture_mask(radius)
+    x = pixel_responses(fwhm, centres[:, None, None] + tracks[..., 0],
+            halfwidth, variation)
+    y = pixel_responses(fwhm, centres[:, None, None] + tracks[..., 1],
+            halfwidth, variation)
+
+    # Flux of each sample, indexed [x position, y position, track, sample],
+    # and its running mean: the flux of an exposure of that many samples
+    flux = np.einsum('itsk,jtsk->ijts', np.dot(x, mask.T), y)
+    flux = np.cumsum(flux, axis=-1) / np.arange(1, MaxSteps + 1)
+    variance = flux.var(axis=2, ddof=1) / flux.mean(axis=2) ** 2
+
+    return (step * np.arange(1, MaxSteps + 1),
+            np.sqrt(variance.mean(axis=(0, 1))))
+
+
+def _interpolate_curve(exptimes, noise, exptime):
+    # Interpolated in log space between the curve's exposure times, held
+    # at the single sample value below them, and falling as
+    # 1 / sqrt(exptime) beyond them, once the exposure averages over many
+    # correlation times
+    longest = exptimes[-1]
+    logexptime = np.log(np.clip(exptime, exptimes[0], longest))
+    values = np.exp(np.interp(logexptime, np.log(exptimes), np.log(noise)))
+    return values * np.sqrt(longest / np.maximum(exptime, longest))
+
+
+def jitter_noise(fwhm, jitter_rms, exptime, radius, variation=0.):
+    '''
+    Fractional jitter noise per exposure for every (broadcast) set of
+    arguments. Each distinct fwhm, jitter rms, radius and variation is
+    simulated once, with `jitter_curve`, and cached; the exposure times
+    are interpolated along its curve.
+    '''
+    values = list(np.broadcast_arrays(*[np.asarray(value, dtype=float)
+        for value in [fwhm, jitter_rms, exptime, radius, variation]]))
+    exptime = values.pop(2).ravel()
+    rows, inverse = np.unique(np.stack([value.ravel() for value in values],
+        axis=-1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    cache = default_cache()
+    noise = np.zeros(exptime.shape)
+    for i, (fwhm, jitter_rms, radius, variation) in enumerate(rows):
+        if jitter_rms <= 0:
+            continue
+        curve = cache.call(jitter_curve, float(fwhm), float(jitter_rms),
+                float(radius), float(variation))
+        selected = inverse == i
+        noise[selected] = _interpolate_curve(*curve,
+                exptime=exptime[selected])
+    return noise.reshape(values[0].shape)
+
+
+def profile_jitter_noise(profile, exptime, jitter_rms=None):
+    '''
+    `jitter_noise` in the saturation aperture (`Config.Radius`) of an
+    `Instrument.InstrumentProfile` or `Instrument.ProfileStack`, with its
+    jitter unless `jitter_rms` is given
+    '''
+    profile = Instrument.get_profile(profile)
+    if jitter_rms is None:
+        jitter_rms = profile.jitter_rms
+    return jitter_noise(profile.fwhm, jitter_rms, exptime, profile.radius,
+            profile.intrapixel_variation)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+'''
+Sorted magnitudes of a field, for counting stars against thresholds
+
+The field counts ask how many stars are brighter than a limit, or fall in
+a magnitude range, for every exposure time. `MagnitudeIndex` sorts the
+magnitudes once, and then answers these for whole arrays of thresholds
+with `numpy.searchsorted`, in O(log stars) per threshold rather than a
+pass over every star, e.g.
+
+    index = MagnitudeIndex(vmags)
+    saturated = index.brighter(limits)
+    high_precision = index.between(saturation_limits, crosspoints)
+
+The counts follow the masks they replace: `brighter(m)` counts mag < m,
+and `between(a, b)` counts a < mag <= b. nan magnitudes are dropped.
+'''
+
+import numpy as np
+
+
+class MagnitudeIndex(object):
+    def __init__(self, mags):
+        super(MagnitudeIndex, self).__init__()
+        mags = np.asarray(mags, dtype=float).ravel()
+        self.mags = np.sort(mags[~np.isnan(mags)])
+
+    @property
+    def size(self):
+        return self.mags.size
+
+    def __len__(self):
+        return self.size
+
+    def brighter(self, limit):
+        '''
+        Number of stars brighter than each `limit`
+        '''
+        return np.searchsorted(self.mags, limit, side='left')
+
+    def between(self, low, high):
+        '''
+        Number of stars fainter than `low` and no fainter than `high`, for
+        each (broadcast) pair
+        '''
+        return np.maximum(np.searchsorted(self.mags, high, side='right') -
+                np.searchsorted(self.mags, low, side='right'), 0)
+
+    def select(self, low=-np.inf, high=np.inf):
+        '''
+        Magnitudes fainter than `low` and no fainter than `high`, in order
+        '''
+        start, end = np.searchsorted(self.mags, [low, high], side='right')
+        return self.mags[start:max(start, end)]
+
+
+def as_index(mags):
+    '''
+    `mags` as a `MagnitudeIndex`, sorting them unless they already are one
+    '''
+    if isinstance(mags, MagnitudeIndex):
+        return mags
+    return MagnitudeIndex(mags)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+'''
+Reproducible, parallel Monte Carlo runs
+
+`MonteCarloRunner` evaluates a function on points drawn from the samplers
+in `Sampling.py`, for several independent replicates, and accumulates the
+results with the constant memory accumulators of `Streaming.py`.
+
+The random streams only depend on the master seed. Replicate `i` uses the
+child `SeedSequence(entropy, spawn_key=(i,))` (the i-th child spawned
+from the master seed), and its points are split into chunks of
+`chunksize`. Each chunk rebuilds its replicate's sampler and skips ahead
+to its first point, so a chunk draws the same points whichever process
+runs it. The chunks are merged in order, so the results are bit-identical
+for any number of processes. They match the serial samplers point for
+point, so the number of processes is purely a speed setting.
+
+The chunks are evaluated with `Sweep.SweepExecutor`, whose process pool
+is kept for every `advance` until the runner is closed (`close()`, or the
+end of a `with` block). The function must
+be importable (defined at module level, or a `functools.partial` of
+one) so it can be sent to the workers. It is given an (n, d) array of
+points in the unit hypercube and returns an accumulator, or a tuple of
+them, with a `merge` method.
+'''
+
+import copy
+import logging
+from functools import partial
+import numpy as np
+from Sampling import make_sampler
+from Sweep import SweepExecutor
+
+logger = logging.getLogger('MonteCarlo')
+
+DefaultChunkSize = 2 ** 16
+
+
+def replicate_seed(entropy, replicate):
+    '''
+    Seed of `replicate`, built afresh so it can be used in any process
+    '''
+    return np.random.SeedSequence(entropy, spawn_key=(replicate,))
+
+
+def merge(accumulator, other):
+    '''
+    Merges `other` into `accumulator`, element by element for tuples
+    '''
+    if isinstance(accumulator, tuple):
+        return tuple(merge(a, b) for (a, b) in zip(accumulator, other))
+    return accumulator.merge(other)
+
+
+def _run_chunk(function, kind, d, entropy, replicate, start, n):
+    sampler = make_sampler(kind, d, replicate_seed(entropy, replicate))
+    if start:
+        sampler.fast_forward(start)
+    return function(sampler.random(n))
+
+
+class MonteCarloRunner(object):
+    '''
+    Accumulates `function` over `replicates` independent streams of `d`
+    dimensional points from a `sampler` ("sobol", "halton" or "random")
+
+    `seed` is the master seed; if it is None fresh entropy is drawn, and
+    it is kept in `entropy` so the run can be repeated. `processes`
+    defaults to the number of cores.
+    '''
+    def __init__(self, function, d, sampler='sobol', replicates=8,
+            seed=None, chunksize=DefaultChunkSize, processes=None):
+        super(MonteCarloRunner, self).__init__()
+        self.function = function
+        self.d = d
+        self.sampler = sampler
+        self.replicates = replicates
+        self.entropy = np.random.SeedSequence(seed).entropy
+        self.chunksize = chunksize
+        self.executor = SweepExecutor(processes=processes, progress=False)
+
+        # Checks the sampler kind, and imports its module before any
+        # workers are forked rather than in each of them
+        make_sampler(sampler, d, replicate_seed(self.entropy, 0))
+
+        self.position = 0
+        self.results = [None] * replicates
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        '''
+        Stops the worker processes
+        '''
+        self.executor.close()
+
+    @property
+    def nsamples(self):
+        '''
+        Points drawn over all replicates
+        '''
+        return self.position * self.replicates
+
+    def advance(self, n):
+        '''
+        Draws the next `n` points of every replicate, and returns the
+        accumulated results of each replicate
+        '''
+        end = self.position + n
+        grid = [(replicate, start, min(self.chunksize, end - start))
+                for replicate in range(self.replicates)
+                for start in range(self.position, end, self.chunksize)]
+
+        worker = partial(_run_chunk, self.function, self.sampler, self.d,
+                self.entropy)
+        chunks = self.executor.starmap(worker, grid)
+
+        for (replicate, start, size), result in zip(grid, chunks):
+            if self.results[replicate] is None:
+                self.results[replicate] = result
+            else:
+                self.results[replicate] = merge(self.results[replicate],
+                        result)
+
+        self.position = end
+        logger.debug('{:d} points per replicate'.format(self.position))
+        return self.results
+
+    def merged(self):
+        '''
+        Results merged over the replicates, in replicate order
+        '''
+        result = copy.deepcopy(self.results[0])
+        for other in self.results[1:]:
+            result = merge(result, other)
+        return result
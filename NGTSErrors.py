@@ -0,0 +1,334 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Single entry point for the NGTS error analysis scripts
+
+Each analysis is a subcommand:
+
+    noise        precision against magnitude (TheoryNoiseWithBinning.py)
+    saturation   time to saturate the central pixel (ErrorContributions.py)
+                 and saturated pixels over the footprint (SaturationMap.py)
+    hprange      high precision range against exposure time
+                 (HighPrecisionRange.py)
+    fieldcounts  saturated stars in the NOMAD fields (NSaturatedInField.py)
+    storage      number of frames and storage required (NumberOfExposures.py)
+
+Only the modules a subcommand needs are imported, when it runs, so e.g.
+`saturation` never loads matplotlib or PyTables. With `--no-plot` the
+results are printed instead of plotted, which is the path to use from
+batch jobs. `--timing` reports the startup and run times on stderr.
+
+Usage:
+    python NGTSErrors.py [--timing] <subcommand> [options]
+    python NGTSErrors.py <subcommand> -h
+'''
+
+import time
+_start = time.time()
+
+import argparse
+import logging
+import resource
+import sys
+
+
+class Timer(object):
+    '''
+    Records the time of named points since the process started
+    '''
+    def __init__(self):
+        super(Timer, self).__init__()
+        self.marks = [('start', _start)]
+
+    def mark(self, name):
+        self.marks.append((name, time.time()))
+
+    def report(self, stream=sys.stderr):
+        for (name, t), (_, previous) in zip(self.marks[1:], self.marks[:-1]):
+            print("%-10s %8.3fs" % (name, t - previous), file=stream)
+        print("%-10s %8.3fs" % ('total', self.marks[-1][1] - _start),
+                file=stream)
+
+        # Includes the interpreter startup before this module was loaded
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        print("%-10s %8.3fs" % ('cpu', usage.ru_utime + usage.ru_stime),
+                file=stream)
+
+
+def noise(args, timer):
+    import numpy as np
+    import Instrument
+    import NoiseModel
+    timer.mark('imports')
+
+    if not args.no_plot:
+        import TheoryNoiseWithBinning
+        # The plotting path is the original script, with its defaults for
+        # the options this command does not expose
+        TheoryNoiseWithBinning.App(argparse.Namespace(totaltime=args.totaltime,
+            exptime=args.exptime, skylevel=args.skylevel, output=args.output,
+            plotwasp=False, plotngts=False, satlimit=True, verbose=True,
+            notitle=False, airmass=args.airmass, darklevel=args.darklevel,
+            render=None, scintillation_method=args.scintillation_method,
+            from_cube=None, precision_target=args.precision_target,
+            jitter=args.jitter))
+        return
+
+    arguments = (args.exptime, args.airmass, args.skylevel, args.totaltime,
+            args.darklevel, args.scintillation_method, args.jitter)
+
+    mag = np.arange(args.mags[0], args.mags[1] + args.step / 2., args.step)
+    contributions = NoiseModel.profile_noise(Instrument.NGTS, mag,
+            *arguments)
+    crosspoint = NoiseModel.profile_crosspoint(Instrument.NGTS,
+            args.precision_target, *arguments)
+
+    print("CROSSPOINT: %f" % crosspoint)
+    print(' '.join(['%6s' % 'mag'] + ['%13s' % name
+        for name in contributions._fields]))
+    for i, value in enumerate(mag):
+        print(' '.join(['%6.2f' % value] + ['%13.6e' % component[i]
+            for component in contributions]))
+
+
+def saturation(args, timer):
+    import numpy as np
+    import Instrument
+    from ErrorContributions import saturation_time
+    timer.mark('imports')
+
+    psf = central_fraction = None
+    if args.psf == 'gaussian' and args.median_fraction:
+        from ErrorContributions import central_pixel_fraction
+        central_fraction = central_pixel_fraction()
+    elif args.psf != 'gaussian':
+        import PSF
+        psf = PSF.make_psf(args.psf, Instrument.NGTS.fwhm, args.moffat_beta,
+                args.psf_supersample)
+        central_fraction = psf.typical_central_fraction()
+
+    mags = np.asarray(args.mags, dtype=float)
+    times = saturation_time(mags, Instrument.NGTS.sky_level[args.skylevel],
+            args.airmass, central_fraction=central_fraction,
+            max_exptime=args.max_exptime)
+
+    for mag, t in zip(mags, times):
+        if np.isinf(t):
+            print("%6.2f  No saturation within %.0f seconds" % (mag,
+                args.max_exptime))
+        else:
+            print("%6.2f  %10.3f" % (mag, t))
+
+    if args.exptimes:
+        from SaturationMap import footprint_saturation
+        exptimes = np.asarray(args.exptimes, dtype=float)
+        footprint = footprint_saturation(mags[:, None], exptimes[None, :],
+                args.skylevel, args.airmass, psf=psf)
+        print("# mag  exptime  peak pixel e-  full well pixels  ADC pixels")
+        for i, mag in enumerate(mags):
+            for j, exptime in enumerate(exptimes):
+                print("%6.2f  %8.2f  %13.1f  %16d  %10d" % (mag, exptime,
+                    footprint.peak[i, j], footprint.nfull_well[i, j],
+                    footprint.nadc[i, j]))
+
+    if not args.no_plot:
+        import matplotlib.pyplot as plt
+
+        plt.plot(mags, times, 'k-')
+        plt.yscale('log')
+        plt.xlabel(r'Magnitude')
+        plt.ylabel(r'Saturation time / s')
+        if args.output:
+            plt.savefig(args.output, bbox_inches='tight')
+        else:
+            plt.show()
+
+
+def hprange(args, timer):
+    import HighPrecisionRange
+    timer.mark('imports')
+
+    app = HighPrecisionRange.App(args)
+    app.run()
+
+    if args.no_plot:
+        for row in zip(app._exptimes, app.crosspoints, app.darkpoints,
+                app.brightpoints):
+            print("%10.3f %8.3f %8.3f %8.3f" % row)
+    else:
+        import PlotHighPrecisionRange
+        PlotHighPrecisionRange.main(args)
+
+
+def fieldcounts(args, timer):
+    import NSaturatedInField
+    from Config import FieldCentre
+    timer.mark('imports')
+
+    app = NSaturatedInField.App(args)
+    if not args.no_plot:
+        app.run()
+        return
+
+    for i, field in enumerate(FieldCentre):
+        if args.probability:
+            # Expected counts with the lower and upper confidence bands
+            columns = [value for counts in app.SaturationBands(i + 1)
+                    for value in counts]
+        else:
+            columns = app.SaturatedCounts(i + 1)
+        print("Field %d,%d" % (field[0], field[1]))
+        for row in zip(10 ** app.exptime, *columns):
+            print(' '.join(["%10.3f" % row[0]] + ["%10g" % value
+                for value in row[1:]]))
+
+
+def storage(args, timer):
+    import NumberOfExposures
+    timer.mark('imports')
+
+    NumberOfExposures.App(args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='NGTS error analysis')
+    parser.add_argument('--timing', help='Report startup and run times on '
+            'stderr', action='store_true')
+    subparsers = parser.add_subparsers(dest='command', metavar='command')
+    subparsers.required = True
+
+    def add_plot_arguments(subparser):
+        subparser.add_argument('--no-plot', help='Print the results instead '
+                'of plotting them', action='store_true')
+        subparser.add_argument('-o', '--output', help='Output device',
+                required=False)
+
+    def skylevel(val):
+        return val.lower()
+
+    sub = subparsers.add_parser('noise', help='Precision against magnitude')
+    sub.add_argument("-e", "--exptime", help="Science exposure time",
+            type=float, required=True)
+    sub.add_argument("-t", "--totaltime", help="Total integration time",
+            default=3600., type=float, required=False)
+    sub.add_argument("-s", "--skylevel", help="Sky type (bright or dark)",
+            choices=["bright", "dark"], type=skylevel, default="dark")
+    sub.add_argument('-a', '--airmass', help='Airmass value',
+            default=1.3, type=float, required=False)
+    sub.add_argument('-d', '--darklevel', help='Level of dark current (e- per second)',
+            default=0.6, type=float, required=False)
+    sub.add_argument('--scintillation-method', required=False, choices={'young', 'osborn'},
+            help="Choose between Young's scintillation method, and Osborn's (default) scintillation method'", default='osborn')
+    sub.add_argument('-p', '--precision-target', help='Fractional '
+            'precision to find the crossing magnitude for (default 1mmag)',
+            default=1E-3, type=float, required=False)
+    sub.add_argument('--jitter', help='Pointing jitter rms per axis in '
+            'pixels (default: the NGTS value, 0 until measured)',
+            type=float, default=None, required=False)
+    sub.add_argument('-m', '--mags', help='Magnitude range to print',
+            nargs=2, type=float, default=[7., 18.], required=False)
+    sub.add_argument('--step', help='Magnitude step to print',
+            type=float, default=0.5, required=False)
+    add_plot_arguments(sub)
+    sub.set_defaults(function=noise)
+
+    sub = subparsers.add_parser('saturation',
+            help='Time to saturate the central pixel')
+    sub.add_argument('-m', '--mags', help='Target magnitudes', nargs='+',
+            type=float, required=True)
+    sub.add_argument("-s", "--skylevel", help="Sky type (bright or dark)",
+            choices=["bright", "dark"], type=skylevel, default="dark")
+    sub.add_argument('-a', '--airmass', help='Airmass value',
+            default=1., type=float, required=False)
+    sub.add_argument('--max-exptime', help='Longest exposure time to '
+            'consider', default=3600., type=float, required=False)
+    sub.add_argument('-t', '--exptimes', help='Also count the saturated '
+            'pixels over the psf footprint at these exposure times '
+            '(SaturationMap.py)', nargs='+', type=float, required=False)
+    sub.add_argument('--psf', help='Psf for the central pixel fraction: '
+            'gaussian (default), moffat, or a supersampled psf image saved '
+            'with numpy.save', default='gaussian', required=False)
+    sub.add_argument('--moffat-beta', help='Moffat psf beta',
+            type=float, required=False, default=2.5)
+    sub.add_argument('--psf-supersample', help='Subpixels per pixel of the '
+            'psf image', type=int, required=False, default=10)
+    sub.add_argument('--median-fraction', help='With the gaussian psf, use '
+            'the median central pixel fraction over psf offsets (about 0.25) '
+            'rather than the centred value (0.2818)', action='store_true')
+    add_plot_arguments(sub)
+    sub.set_defaults(function=saturation)
+
+    sub = subparsers.add_parser('hprange',
+            help='High precision range against exposure time')
+    sub.add_argument('-j', '--processes', help='Number of processes '
+            '(default: number of cores)', type=int, required=False,
+            default=None)
+    sub.add_argument('-e', '--exptimes', help='Exposure times to '
+            'calculate (default: 20 between 1 and 50 seconds)', type=float,
+            nargs='+', required=False, default=None)
+    sub.add_argument('--clean', help='Recompute every exposure time '
+            'rather than reusing stored results', action='store_true')
+    sub.add_argument('-y', '--yes', help='Generate the data without '
+            'asking first', action='store_true')
+    add_plot_arguments(sub)
+    sub.set_defaults(function=hprange)
+
+    sub = subparsers.add_parser('fieldcounts',
+            help='Saturated stars in the NOMAD fields')
+    sub.add_argument("-f", "--fraction", help="Count as fraction",
+            action="store_true", default=False)
+    sub.add_argument("-b", "--band", help="Filter to use",
+            default="I", type=str, required=False)
+    sub.add_argument("-p", "--probability", help="Expected counts from the "
+            "saturation probability of each star, over the psf offset "
+            "distribution", action="store_true", default=False)
+    sub.add_argument("--confidence", help="Confidence level of the expected "
+            "count bands", type=float, default=0.95, required=False)
+    add_plot_arguments(sub)
+    sub.set_defaults(function=fieldcounts)
+
+    sub = subparsers.add_parser('storage',
+            help='Number of frames and storage required')
+    sub.add_argument("exptime", help="Science exposure time", type=float)
+    sub.add_argument("-y", "--years", help="Number of years to simulate",
+            required=False, default=1, type=float)
+    sub.set_defaults(function=storage)
+
+    return parser
+
+
+def main(argv=None):
+    timer = Timer()
+    args = build_parser().parse_args(argv)
+    timer.mark('startup')
+
+    try:
+        args.function(args, timer)
+    except RuntimeError as e:
+        print("Error:", e, file=sys.stderr)
+        return 1
+    except ImportError as e:
+        # Subcommands import their modules when they run, so a missing
+        # dependency only shows up here
+        if e.name is None:
+            print("Error: %s needs %s" % (args.command, e), file=sys.stderr)
+        else:
+            print("Error: %s needs the %s module, which could not be "
+                    "imported" % (args.command, e.name), file=sys.stderr)
+        return 1
+    finally:
+        timer.mark('run')
+        if args.timing:
+            timer.report()
+
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("Interrupt caught, exiting...", file=sys.stderr)
+        sys.exit(0)
@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-from Config import *
 import pickle
 import sys
+import logging
 import numpy as np
 import tables
 from scipy.interpolate import interp1d
@@ -11,6 +11,9 @@ from scipy.interpolate import interp1d
 from NOMADFields import NOMADFieldsParser
 import matplotlib.pyplot as plt
 import BesanconParser
+from ResultStore import ResultStore, file_hash
+from MagnitudeIndex import MagnitudeIndex
+from ColumnCache import default_cache
 
 
 exptimes, crosspoints, satpoints = pickle.load(open("precisiondata.cpickle"))
@@ -48,6 +51,7 @@ class DataStore(object):
                 }
 
         self.data = None
+        self.index = None
         self.currentField = None
 
 
@@ -55,44 +59,56 @@ class DataStore(object):
     def setField(self, field):
         self.currentField = field
         self.fetch()
+        self.index = MagnitudeIndex(self.data)
 
     def visible(self):
         '''
         Returns the magnitudes of all of the visible
         mag < 17 objects
         '''
-        return self.data[self.data < 17]
+        return self.index.mags[:self.index.brighter(17)]
 
     def highPrecision(self, e):
         '''
         Returns all of the magnitudes of the
         high precision objects
         '''
-        hpRange = rangeAtExptime(e)
-        return self.data[(self.data > hpRange[0]) & (self.data <= hpRange[1])]
+        return self.index.select(*rangeAtExptime(e))
 
     def nVisible(self):
         '''
         Returns the number of visible objects
         '''
-        #return len(self.visible())
-        return self.visible().size
+        return int(self.index.brighter(17))
 
     def nHighPrecision(self, e):
         '''
         Returns the number of high precision objects
         '''
-        #return len(self.highPrecision(e))
-        return self.highPrecision(e).size
+        return int(self.index.between(*rangeAtExptime(e)))
 
     def percentage(self, t):
         return float(self.nHighPrecision(t)) * 100. / float(self.nVisible())
 
-    def fetch(self):
+    def columns(self, field):
+        '''
+        The `ColumnCache.load` arguments for the magnitudes of a field
+        '''
         raise NotImplementedError()
 
+    def fetch(self):
+        self.data = default_cache().load(*self.columns(self.currentField))
+
+    def sourceHash(self, field):
+        '''
+        Hash of the catalogue contents the field is read from
+        '''
+        return default_cache().source_hash(*self.columns(field))
+
     def close(self):
-        self.parser.close()
+        # The catalogues are only open while columns are exported to the
+        # column cache
+        pass
 
 
 class NOMADDataStore(DataStore):
@@ -105,13 +121,11 @@ class NOMADDataStore(DataStore):
 
         super(NOMADDataStore, self).__init__()
 
-        self.parser = NOMADFieldsParser()
 
 
-
-    def fetch(self):
-        self.data = self.parser.getTable("/fields", "field%d" % self.currentField).cols.vmagnitude[:]
-        self.data = self.data[self.data != 0]
+    def columns(self, field):
+        return (NOMADFieldsParser, "/fields/field%d" % field, 'vmagnitude',
+                'vmagnitude != 0')
 
 
 
@@ -129,21 +143,16 @@ class BesanconDataStore(DataStore):
         super(BesanconDataStore, self).__init__()
         self.restr = restr
 
-    def fetch(self):
-        self.parser = BesanconParser.BesanconParser()
-
-        node = self.parser.getTable("/fields", "field%d" % self.currentField)
-
-        if self.restr:
-            self.data = np.array([row['imagnitude'] for row in node.where(self.restr)])
-        else:
-            self.data = node.cols.imagnitude[:]
+    def columns(self, field):
+        return (BesanconParser.BesanconParser, "/fields/field%d" % field,
+                'imagnitude', self.restr or None)
 
 
 
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     exptimes = np.linspace(5, 90, 50)
     #exptimes = [5,]
 
@@ -157,6 +166,11 @@ if __name__ == '__main__':
     fig = plt.figure()
     profileAx = fig.add_subplot(111)
 
+    # Percentages are reused until the precision data or the catalogue
+    # (whose hash is part of each key) changes
+    store = ResultStore('NHighPrecisionObjects',
+            [file_hash('precisiondata.cpickle'), ModelRestrictions])
+
     with tables.open_file('out.h5', 'w') as outfile:
         outfile.create_array('/', 'exptime', exptimes)
 
@@ -165,16 +179,25 @@ if __name__ == '__main__':
             print(parser['name'])
             for i, field in enumerate(fields):
                 print("\tField %d" % field)
-                parser['parser'].setField(field)
+                source = parser['parser'].sourceHash(field)
+                keys = [(parser['name'], field, source, e) for e in exptimes]
+
+                # Only read the catalogue if there is something to compute
+                if not all(key in store for key in keys):
+                    parser['parser'].setField(field)
+
+                    visibleMags[parser['name']] = parser['parser'].visible()
 
-                visibleMags[parser['name']] = parser['parser'].visible()
+                    for key in keys:
+                        if key not in store:
+                            store.put(key, parser['parser'].percentage(key[-1]))
 
                 if parser['name'] == "NOMAD":
                     ls = "-"
                 elif parser['name'] == "Besancon":
                     ls = "--"
 
-                data = [parser['parser'].percentage(e) for e in exptimes]
+                data = [store.get(key) for key in keys]
                 profileAx.plot(exptimes, data, label="%s %d" % (parser['name'], field),
                         color='k', ls=linestyles[i])
 
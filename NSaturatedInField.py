@@ -3,14 +3,18 @@
 import sys
 import os.path
 import argparse
+import logging
 import numpy as np
 import pickle
 from jg.ctx import j20002gal
 from subprocess import Popen, PIPE, call
-from Config import *
-import matplotlib.pyplot as plt
+from Config import FieldCentre, PixScale
+import Instrument
 from NOMADFields import NOMADFieldsParser
 from fits import Fits
+from MagnitudeIndex import MagnitudeIndex
+from ColumnCache import default_cache
+from SaturationProbability import SaturationProbability, SaturationCounts
 
 class App(object):
     """
@@ -22,7 +26,6 @@ class App(object):
         """
         super(App, self).__init__()
         self.args = args
-        self.parser = NOMADFieldsParser()
         self.colours = ['r', 'k', 'b']
 
 
@@ -37,7 +40,7 @@ class App(object):
         \pi r^2 = x y
         r = sqrt(x * y / pi)
         '''
-        npix = NAXIS1
+        npix = Instrument.NGTS.naxis1
         pixscale = PixScale
 
         # get the dimensions in arcminutes
@@ -61,6 +64,11 @@ class App(object):
         self.brightSaturLevel = self.brightFit(self.exptime)
         self.darkSaturLevel = self.darkFit(self.exptime)
 
+        # saturation probabilities from the psf offset distribution
+        if self.args.probability:
+            self.brightProbability = SaturationProbability(skylevel='bright')
+            self.darkProbability = SaturationProbability(skylevel='dark')
+
         # plotting variables
         self.xmin = self.exptime.min()
         self.xmax = self.exptime.max()
@@ -69,31 +77,74 @@ class App(object):
 
 
     def GetCatalogueData(self, field_id):
-        table_name = 'field{:d}'.format(field_id)
-        table = self.parser.getTable('/fields', table_name)
-        vmags = table.cols.vmagnitude[:]
-        return vmags[vmags > 0]
+        return default_cache().load(NOMADFieldsParser,
+                '/fields/field{:d}'.format(field_id), 'vmagnitude',
+                'vmagnitude > 0')
+
+    def SaturatedCounts(self, field_id):
+        '''
+        Returns the number of saturated stars in bright and dark time
+        for each exposure time, as fractions if requested. With
+        `--probability` these are the expected numbers.
+        '''
+        if self.args.probability:
+            brightCounts, darkCounts = self.SaturationBands(field_id)
+            return brightCounts.expected, darkCounts.expected
+
+        # Fetch the list of objects
+        mags = MagnitudeIndex(self.GetCatalogueData(field_id))
+        print("%d objects returned" % (mags.size,))
+
+        # Get the number of saturated stars
+        # Normalise to make fraction
+        brightNumbers = mags.brighter(self.brightSaturLevel)
+        darkNumbers = mags.brighter(self.darkSaturLevel)
+
+        if self.args.fraction:
+            brightNumbers = brightNumbers / float(mags.size)
+            darkNumbers = darkNumbers / float(mags.size)
+
+        return brightNumbers, darkNumbers
+
+    def SaturationBands(self, field_id):
+        '''
+        Returns the expected numbers of saturated stars in bright and dark
+        time for each exposure time, with their confidence bands, from the
+        probability that each star saturates
+        '''
+        mags = MagnitudeIndex(self.GetCatalogueData(field_id))
+        print("%d objects returned" % (mags.size,))
+
+        exptime = 10 ** self.exptime
+        counts = [probability.counts(mags, exptime, self.args.confidence)
+                for probability in [self.brightProbability,
+                    self.darkProbability]]
+
+        if self.args.fraction:
+            counts = [SaturationCounts(*[values / float(mags.size)
+                for values in count]) for count in counts]
+
+        return counts
 
     def run(self):
+        import matplotlib.pyplot as plt
+
         fig = plt.figure()
         ax = fig.add_subplot(111)
         for i, field in enumerate(self.FieldCentre):
             print("Analysing field %d,%d" % (field[0], field[1]))
             galcoords = j20002gal(field[0], field[1])
 
-            # Fetch the list of objects
-            mags = self.GetCatalogueData(i + 1)
-            print("%d objects returned" % (mags.size,))
-
-            # Get the number of saturated stars
-            # Normalise to make fraction
-            brightNumbers = np.array([mags[mags<level].size for level in self.brightSaturLevel])
-            darkNumbers = np.array([mags[mags<level].size for level in self.darkSaturLevel])
-
-            if self.args.fraction:
-                brightNumbers = brightNumbers / float(mags.size)
-                darkNumbers = darkNumbers / float(mags.size)
-
+            if self.args.probability:
+                brightCounts, darkCounts = self.SaturationBands(i + 1)
+                for counts in [brightCounts, darkCounts]:
+                    ax.fill_between(10 ** self.exptime, counts.low,
+                            counts.high, color=self.colours[i], alpha=0.2,
+                            lw=0)
+                brightNumbers, darkNumbers = (brightCounts.expected,
+                        darkCounts.expected)
+            else:
+                brightNumbers, darkNumbers = self.SaturatedCounts(i + 1)
 
             ax.plot(10 ** self.exptime, brightNumbers, ls='--',
                     color=self.colours[i])
@@ -122,6 +173,7 @@ class App(object):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     import warnings
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", r'.*use PyArray_AsCArray.*')
@@ -132,6 +184,12 @@ if __name__ == '__main__':
                 action="store_true", default=False)
         parser.add_argument("-b", "--band", help="Filter to use",
                 default="I", type=str, required=False)
+        parser.add_argument("-p", "--probability", help="Expected counts "
+                "from the saturation probability of each star, over the "
+                "psf offset distribution", action="store_true", default=False)
+        parser.add_argument("--confidence", help="Confidence level of the "
+                "expected count bands", type=float, default=0.95,
+                required=False)
         args = parser.parse_args()
         app = App(args)
         app.run()
@@ -0,0 +1,294 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Memoisation of noise model evaluations
+
+`NoiseCache` keeps the results of noise model calls in an in-memory LRU,
+backed by an on-disk store with a size cap which evicts the least recently
+used entries. Keys are a canonical hash of the function, its arguments,
+the instrument profile and the source of the code it runs (see
+`source_hash`), so repeated runs of the scripts (and different scripts
+asking the same question) hit the cache, and changing the instrument or
+the model, including module constants such as the jitter simulation
+sizes, never returns stale results.
+
+Only calls which are expensive enough to be worth a disk read belong
+here; closed forms such as the saturation time are cheaper to evaluate.
+
+Running this script prints the cache statistics, or clears the cache with
+`--clear`.
+'''
+
+import argparse
+import atexit
+import fcntl
+import functools
+import inspect
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from ResultStore import canonical_hash, file_hash
+
+logger = logging.getLogger('NoiseCache')
+
+DefaultPath = '.noisecache'
+
+_source_hashes = {}
+
+
+def source_hash(function):
+    '''
+    Hash of the source files of the module defining `function` and of
+    every module of this package it reaches through module level names,
+    so editing any code or constant the function may use changes the hash
+    '''
+    module_name = function.__module__
+    if module_name not in _source_hashes:
+        package = os.path.dirname(os.path.abspath(__file__))
+        pending, filenames = [sys.modules[module_name]], {}
+        while pending:
+            module = pending.pop()
+            filename = getattr(module, '__file__', None)
+            if (filename is None or os.path.dirname(os.path.abspath(
+                    filename)) != package or module.__name__ in filenames):
+                continue
+            filenames[module.__name__] = filename
+            # Imported modules, and the modules of imported names
+            for value in vars(module).values():
+                if inspect.ismodule(value):
+                    pending.append(value)
+                elif getattr(value, '__module__', None) in sys.modules:
+                    pending.append(sys.modules[value.__module__])
+        _source_hashes[module_name] = canonical_hash(sorted(
+            (name, file_hash(filename)) for (name, filename)
+            in filenames.items()))
+    return _source_hashes[module_name]
+
+
+class NoiseCache(object):
+    '''
+    Two tier cache, holding `maxsize` results in memory and up to
+    `max_disk_bytes` on disk under `path`. `config` is hashed into every
+    key. A cache can be shared between threads, e.g. those of the noise
+    daemon.
+    '''
+    def __init__(self, config=None, path=DefaultPath, maxsize=256,
+            max_disk_bytes=256 * 1024 ** 2):
+        super(NoiseCache, self).__init__()
+        self.config_hash = canonical_hash(config)
+        self.path = path
+        self.maxsize = maxsize
+        self.max_disk_bytes = max_disk_bytes
+
+        # Guards the memory and disk entries and the counts
+        self.lock = threading.RLock()
+        self.memory = OrderedDict()
+        self.memory_hits = self.disk_hits = self.misses = 0
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        # Disk entries in least recently used order
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.pickle'):
+                stat = os.stat(os.path.join(self.path, name))
+                entries.append((stat.st_mtime, name[:-len('.pickle')],
+                    stat.st_size))
+        self.disk = OrderedDict((key, size) for (mtime, key, size) in
+                sorted(entries))
+        self.disk_bytes = sum(self.disk.values())
+
+    def _filename(self, key):
+        return os.path.join(self.path, key + '.pickle')
+
+    def key(self, function, *args, **kwargs):
+        '''
+        Hash of the call, with the arguments bound to the function
+        signature so positional and keyword forms give the same key
+        '''
+        try:
+            bound = inspect.signature(function).bind(*args, **kwargs)
+            bound.apply_defaults()
+            arguments = dict(bound.arguments)
+        except (TypeError, ValueError):
+            arguments = [args, kwargs]
+
+        return canonical_hash(self.config_hash, function.__module__,
+                function.__name__, source_hash(function), arguments)
+
+    def get(self, key):
+        '''
+        Returns (True, value) on a hit, or (False, None)
+        '''
+        with self.lock:
+            if key in self.memory:
+                self.memory.move_to_end(key)
+                self.memory_hits += 1
+                return True, self.memory[key]
+
+            if key in self.disk:
+                try:
+                    with open(self._filename(key), 'rb') as infile:
+                        value = pickle.load(infile)
+                    os.utime(self._filename(key), None)
+                except (IOError, OSError, EOFError, pickle.UnpicklingError):
+                    self._remove_disk(key)
+                else:
+                    self.disk.move_to_end(key)
+                    self.disk_hits += 1
+                    self._put_memory(key, value)
+                    return True, value
+
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        # Written to a temporary file outside of the lock, and renamed
+        # into place, so readers never see part of an entry
+        handle, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as outfile:
+            pickle.dump(value, outfile, protocol=2)
+        size = os.path.getsize(tmpname)
+
+        with self.lock:
+            self._put_memory(key, value)
+            os.rename(tmpname, self._filename(key))
+
+            if key in self.disk:
+                self.disk_bytes -= self.disk.pop(key)
+            self.disk[key] = size
+            self.disk_bytes += size
+
+            while self.disk_bytes > self.max_disk_bytes and len(self.disk) > 1:
+                self._remove_disk(next(iter(self.disk)))
+
+    def _put_memory(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.maxsize:
+            self.memory.popitem(last=False)
+
+    def _remove_disk(self, key):
+        self.disk_bytes -= self.disk.pop(key, 0)
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    def call(self, function, *args, **kwargs):
+        '''
+        Returns function(*args, **kwargs), from the cache if possible.
+        The result is shared between callers so must not be modified.
+        The function runs outside of the lock, so threads missing the
+        same key at once may each evaluate it.
+        '''
+        key = self.key(function, *args, **kwargs)
+        hit, value = self.get(key)
+        if not hit:
+            value = function(*args, **kwargs)
+            self.put(key, value)
+        return value
+
+    def memoize(self, function):
+        '''
+        Decorator form of `call`
+        '''
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            return self.call(function, *args, **kwargs)
+        return wrapper
+
+    def stats(self):
+        with self.lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                    'memory_hits': self.memory_hits,
+                    'disk_hits': self.disk_hits,
+                    'misses': self.misses,
+                    'hit_rate': (float(self.memory_hits + self.disk_hits) /
+                        lookups if lookups else 0.),
+                    'memory_entries': len(self.memory),
+                    'disk_entries': len(self.disk),
+                    'disk_bytes': self.disk_bytes,
+                    }
+
+    def record_stats(self):
+        '''
+        Adds this process' hits and misses to the running totals kept
+        with the disk cache, and logs them
+        '''
+        stats = self.stats()
+        logger.info('Noise cache: {memory_hits} memory hits, {disk_hits} '
+                'disk hits, {misses} misses'.format(**stats))
+
+        # Other processes, e.g. sweep workers, add theirs at the same
+        # time, so the update holds a lock on the stats file
+        with open(os.path.join(self.path, 'stats.lock'), 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                totals = read_totals(self.path)
+                for name in ['memory_hits', 'disk_hits', 'misses']:
+                    totals[name] = totals.get(name, 0) + stats[name]
+                handle, tmpname = tempfile.mkstemp(dir=self.path,
+                        suffix='.tmp')
+                with os.fdopen(handle, 'w') as outfile:
+                    json.dump(totals, outfile)
+                os.rename(tmpname, os.path.join(self.path, 'stats.json'))
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+
+def read_totals(path=DefaultPath):
+    try:
+        with open(os.path.join(path, 'stats.json')) as infile:
+            return json.load(infile)
+    except (IOError, ValueError):
+        return {}
+
+
+_default_cache = None
+
+
+def default_cache():
+    '''
+    The cache shared by the scripts, keyed on the NGTS instrument profile.
+    Statistics are recorded when the process exits.
+    '''
+    global _default_cache
+    if _default_cache is None:
+        import Instrument
+
+        _default_cache = NoiseCache(Instrument.NGTS.cache_key())
+        atexit.register(_default_cache.record_stats)
+    return _default_cache
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-p', '--path', help='Cache directory',
+            default=DefaultPath, required=False)
+    parser.add_argument('--clear', help='Remove every cached result',
+            action='store_true')
+    args = parser.parse_args()
+
+    cache = NoiseCache(path=args.path)
+    if args.clear:
+        for key in list(cache.disk):
+            cache._remove_disk(key)
+        if os.path.exists(os.path.join(args.path, 'stats.json')):
+            os.remove(os.path.join(args.path, 'stats.json'))
+
+    totals = read_totals(args.path)
+    lookups = sum(totals.get(name, 0) for name in ['memory_hits', 'disk_hits', 'misses'])
+    print("%d entries, %.1f MB on disk" % (len(cache.disk), cache.disk_bytes / 1024. ** 2))
+    print("%d memory hits, %d disk hits, %d misses" % tuple(totals.get(name, 0)
+        for name in ['memory_hits', 'disk_hits', 'misses']))
+    if lookups:
+        print("Hit rate: %.1f%%" % (100. * (lookups - totals.get('misses', 0)) / lookups))
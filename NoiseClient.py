@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+
+'''
+Client for the noise model query server in `NoiseDaemon.py`
+
+Only uses the standard library, so importing it costs nothing. Results
+come back as plain lists and dictionaries, e.g.
+
+    with NoiseClient() as client:
+        times = client.saturation_time([9, 10, 11], skylevel='bright')
+        stats = client.precision([5, 10, 30])
+        crosspoints = stats['crosspoint']
+'''
+
+import json
+import socket
+
+DefaultSocket = '/tmp/noisedaemon.sock'
+
+
+class NoiseQueryError(Exception):
+    pass
+
+
+class NoiseClient(object):
+    '''
+    Connection to a running `NoiseDaemon`, over the unix socket `path` or
+    a localhost `port` if given
+    '''
+    def __init__(self, path=DefaultSocket, port=None):
+        super(NoiseClient, self).__init__()
+        if port is not None:
+            self.socket = socket.create_connection(('127.0.0.1', port))
+            self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(path)
+        self.stream = self.socket.makefile('rwb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.stream.close()
+        self.socket.close()
+
+    def _send(self, request):
+        self.stream.write(json.dumps(request).encode('utf-8') + b'\n')
+        self.stream.flush()
+        line = self.stream.readline()
+        if not line:
+            raise NoiseQueryError("Connection closed by the server")
+        return json.loads(line.decode('utf-8'))
+
+    @staticmethod
+    def _result(response):
+        if 'error' in response:
+            raise NoiseQueryError(response['error'])
+        return response['result']
+
+    def query(self, query, **arguments):
+        '''
+        Sends a single query, returning its result
+        '''
+        arguments['query'] = query
+        return self._result(self._send(arguments))
+
+    def batch(self, queries):
+        '''
+        Sends a list of query dictionaries in one round trip, returning
+        the list of results. A failed query raises `NoiseQueryError`.
+        '''
+        return [self._result(response) for response in
+                self._send(list(queries))]
+
+    def noise(self, mag, exptime, **arguments):
+        return self.query('noise', mag=mag, exptime=exptime, **arguments)
+
+    def precision(self, exptime, **arguments):
+        return self.query('precision', exptime=exptime, **arguments)
+
+    def saturation_time(self, mag, **arguments):
+        return self.query('saturation_time', mag=mag, **arguments)
+
+    def saturation_magnitude(self, exptime, **arguments):
+        return self.query('saturation_magnitude', exptime=exptime,
+                **arguments)
+
+    def ping(self):
+        return self.query('ping')
@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Precomputed noise cube
+
+`ErrorContributions.py` and `TheoryNoiseWithBinning.py` plot two slices
+through the same magnitude/exposure time/fractional error cube. This
+script evaluates the whole cube once, over magnitude, exposure time,
+airmass, sky level and binned integration time, into a chunked and
+compressed HDF5 file. `NoiseCube` then returns any slice through it,
+interpolating between the grid nodes.
+
+Usage:
+    python NoiseCube.py -o noisecube.h5
+
+The scripts which read a cube refuse one built with parameters other than
+their own. For `ErrorContributions.py`, which uses the full psf aperture,
+its zero point and Young's scintillation, build it with e.g.
+
+    python NoiseCube.py -o noisecube.h5 -d 6 --scintillation-method young \
+            -z 20.50485 --npix 18.09557
+'''
+
+import argparse
+import logging
+import numpy as np
+import tables
+import Instrument
+import JitterNoise
+import NoiseModel
+
+logger = logging.getLogger('NoiseCube')
+
+Axes = ['mag', 'exptime', 'airmass', 'sky', 'bintime']
+Components = list(NoiseModel.NoiseContributions._fields)
+
+# Axes which are interpolated in log space
+LogAxes = set(['exptime', 'bintime'])
+
+DefaultGrid = {
+        'mag': np.linspace(5., 20., 151),
+        'exptime': 10 ** np.linspace(0., np.log10(3600.), 50),
+        'airmass': np.linspace(1., 3., 11),
+        'sky': np.array([5., 10., 20., 40., 80., 150., 200., 300.]),
+        'bintime': 10 ** np.linspace(np.log10(300.), np.log10(14400.), 5),
+        }
+
+
+def build_cube(filename, readtime, readnoise, darklevel=0.,
+        scintillation_method='osborn', parameters=None, grid=None,
+        complevel=5, jitter_rms=None):
+    '''
+    Evaluates the noise model over the full grid and writes it to
+    `filename`.
+
+    `parameters` defaults to `NoiseModel.NGTSParameters`, and `grid`
+    can override any of the axes in `DefaultGrid`. The jitter term is for
+    the NGTS psf and pixels, with `jitter_rms` defaulting to the NGTS
+    value.
+    '''
+    parameters = dict(parameters or NoiseModel.NGTSParameters)
+    axes = dict(DefaultGrid)
+    axes.update(grid or {})
+    axes = dict((name, np.asarray(axes[name], dtype=float)) for name in Axes)
+    shape = tuple(axes[name].size for name in Axes)
+
+    filters = tables.Filters(complevel=complevel, complib='zlib',
+            shuffle=True)
+    # Each chunk holds every magnitude for a few exposure times, which
+    # matches both the magnitude and exposure time slices
+    chunkshape = (shape[0], min(shape[1], 8), 1, 1, 1)
+
+    with tables.open_file(filename, 'w') as outfile:
+        axis_group = outfile.create_group('/', 'axes', 'Grid axes')
+        for name in Axes:
+            outfile.create_array(axis_group, name, axes[name])
+
+        cube_group = outfile.create_group('/', 'cube', 'Noise contributions')
+        arrays = dict((component, outfile.create_carray(cube_group,
+            component, tables.Float32Atom(), shape, filters=filters,
+            chunkshape=chunkshape)) for component in Components)
+
+        mag, exptime, airmass, sky = np.meshgrid(axes['mag'],
+                axes['exptime'], axes['airmass'], axes['sky'],
+                indexing='ij', sparse=True)
+        jitter = JitterNoise.profile_jitter_noise(Instrument.NGTS, exptime,
+                jitter_rms)
+        for i, bintime in enumerate(axes['bintime']):
+            logger.info('Evaluating bin time {:.1f}s'.format(bintime))
+            noise = NoiseModel.noise_contributions(mag, exptime, airmass,
+                    sky, parameters['npix'], readtime,
+                    parameters['extinction'], bintime, parameters['height'],
+                    parameters['apsize'], parameters['zp'], readnoise,
+                    darklevel, scintillation_method=scintillation_method,
+                    jitter=jitter)
+            for component in Components:
+                arrays[component][..., i] = getattr(noise, component)
+
+        attrs = cube_group._v_attrs
+        for key, value in parameters.items():
+            setattr(attrs, key, value)
+        attrs.readtime = readtime
+        attrs.readnoise = readnoise
+        attrs.darklevel = darklevel
+        attrs.scintillation_method = scintillation_method
+        attrs.jitter_rms = (Instrument.NGTS.jitter_rms if jitter_rms is None
+                else jitter_rms)
+
+
+def _interpolation_weights(grid, values, log):
+    '''
+    Returns the lower node index and weight of the upper node for
+    linear interpolation of `values` along `grid`
+    '''
+    values = np.atleast_1d(np.asarray(values, dtype=float))
+    if log:
+        grid, values = np.log10(grid), np.log10(values)
+
+    if grid.size == 1:
+        if not np.allclose(values, grid[0]):
+            raise ValueError("Axis only contains a single value")
+        return np.zeros(values.size, dtype=int), np.zeros(values.size)
+
+    tolerance = 1E-9 * (grid[-1] - grid[0])
+    if (values < grid[0] - tolerance).any() or (
+            values > grid[-1] + tolerance).any():
+        raise ValueError("Values outside of the cube range {} - {}".format(
+            grid[0], grid[-1]))
+
+    index = np.clip(np.searchsorted(grid, values, side='right') - 1, 0,
+            grid.size - 2)
+    weight = (values - grid[index]) / (grid[index + 1] - grid[index])
+    return index, np.clip(weight, 0., 1.)
+
+
+class NoiseCube(object):
+    '''
+    Reader for a noise cube created with `build_cube`
+    '''
+    def __init__(self, filename):
+        super(NoiseCube, self).__init__()
+        self.filename = filename
+        self.h5file = tables.open_file(filename)
+        self.axes = dict((name, self.h5file.get_node('/axes', name).read())
+                for name in Axes)
+
+        attrs = self.h5file.root.cube._v_attrs
+        self.parameters = dict((key, getattr(attrs, key))
+                for key in attrs._v_attrnamesuser)
+        self.scintillation_method = self.parameters.pop('scintillation_method')
+        # Cubes built before the jitter term have none
+        self.parameters.setdefault('jitter_rms', 0.)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.h5file.close()
+
+    def check(self, **expected):
+        '''
+        Raises ValueError, naming every difference, unless the cube was
+        built with the `expected` parameters, e.g. `check(zp=21.1,
+        darklevel=0.6, scintillation_method='osborn')`, so that a slice
+        matches the noise model it replaces
+        '''
+        built = dict(self.parameters,
+                scintillation_method=self.scintillation_method)
+        differences = []
+        for key, value in sorted(expected.items()):
+            if key not in built:
+                differences.append('{} (not in the cube)'.format(key))
+            elif isinstance(value, str) or isinstance(built[key], str):
+                if built[key] != value:
+                    differences.append('{} {} (expected {})'.format(key,
+                        built[key], value))
+            elif not np.isclose(built[key], value):
+                differences.append('{} {:g} (expected {:g})'.format(key,
+                    float(built[key]), float(value)))
+        if differences:
+            raise ValueError("Noise cube {} was built with different "
+                    "parameters: {}".format(self.filename,
+                        ', '.join(differences)))
+
+    def slice(self, component, **coordinates):
+        '''
+        Returns a slice through the cube for a single noise component
+
+        Each axis in `Axes` can be given as a scalar, which fixes that axis
+        and removes it from the output, as an array of values to sample
+        along it, or left out to return the grid nodes. Values between the
+        grid nodes are interpolated, in log space for the noise and the
+        exposure and bin times. The output dimensions are in the order of
+        `Axes`, e.g.
+
+            cube.slice('total', exptime=10., airmass=1.3, sky=20.,
+                bintime=3600.)
+
+        returns the total noise at every magnitude node.
+        '''
+        unknown = set(coordinates) - set(Axes)
+        if unknown:
+            raise ValueError("Unknown axes: {}".format(', '.join(unknown)))
+
+        array = self.h5file.get_node('/cube', component)
+
+        # Only read the block of nodes which are needed
+        selections, interpolations, scalars = [], [], []
+        for name in Axes:
+            value = coordinates.get(name)
+            if value is None:
+                selections.append(slice(None))
+                interpolations.append(None)
+                continue
+
+            index, weight = _interpolation_weights(self.axes[name], value,
+                    name in LogAxes)
+            low = index.min()
+            high = min(index.max() + 2, self.axes[name].size)
+            selections.append(slice(low, high))
+            upper = np.minimum(index + 1, self.axes[name].size - 1)
+            interpolations.append((index - low, upper - low, weight))
+            if np.ndim(value) == 0:
+                scalars.append(Axes.index(name))
+
+        data = array[tuple(selections)].astype(float)
+
+        logspace = (data > 0).all()
+        if logspace:
+            data = np.log10(data)
+
+        for axis, interpolation in enumerate(interpolations):
+            if interpolation is None:
+                continue
+
+            lower, upper, weight = interpolation
+            shape = [1] * data.ndim
+            shape[axis] = weight.size
+            weight = weight.reshape(shape)
+            data = (np.take(data, lower, axis=axis) * (1. - weight) +
+                    np.take(data, upper, axis=axis) * weight)
+
+        data = np.squeeze(data, axis=tuple(scalars))
+        return 10 ** data if logspace else data
+
+    def contributions(self, **coordinates):
+        '''
+        Returns every noise component for the same slice, as
+        `NoiseModel.NoiseContributions`. Components which are not in the
+        cube, e.g. jitter in cubes built before it was added, are zero.
+        '''
+        slices = dict((component, self.slice(component, **coordinates))
+                for component in Components
+                if '/cube/' + component in self.h5file)
+        return NoiseModel.NoiseContributions(*[slices.get(component,
+            np.zeros_like(slices['total'])) for component in Components])
+
+
+if __name__ == '__main__':
+    from Config import ReadNoise, ReadTime
+
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-o', '--output', help='Output cube filename',
+            default='noisecube.h5', required=False)
+    parser.add_argument('-d', '--darklevel', help='Level of dark current (e- per second)',
+            default=0.6, type=float, required=False)
+    parser.add_argument('--scintillation-method', required=False, choices={'young', 'osborn'},
+            help="Choose between Young's scintillation method, and Osborn's (default) scintillation method'", default='osborn')
+    parser.add_argument('--jitter', help='Pointing jitter rms per axis in '
+            'pixels (default: the NGTS value, 0 until measured)',
+            type=float, default=None, required=False)
+    parser.add_argument('-z', '--zeropoint', help='Zero point for a 1 second '
+            'exposure (default: the NGTS value)', type=float, default=None,
+            required=False)
+    parser.add_argument('--npix', help='Pixels in the photometry aperture '
+            '(default: the NGTS value)', type=float, default=None,
+            required=False)
+    args = parser.parse_args()
+
+    parameters = dict(NoiseModel.NGTSParameters)
+    if args.zeropoint is not None:
+        parameters['zp'] = args.zeropoint
+    if args.npix is not None:
+        parameters['npix'] = args.npix
+
+    build_cube(args.output, ReadTime, ReadNoise, args.darklevel,
+            scintillation_method=args.scintillation_method,
+            parameters=parameters, jitter_rms=args.jitter)
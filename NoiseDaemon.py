@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+'''
+Long lived noise model query server
+
+Loads the configuration and saturation fits once and then answers JSON
+queries, so planning tools asking many small "what precision / when does
+it saturate" questions do not pay the startup cost of the scripts each
+time. Use `NoiseClient.NoiseClient` to talk to
+it.
+
+Each request is a single line of JSON, either one query object or a list
+of them, and the response is one line of JSON with the result (or list of
+results). Every query has a "query" key naming one of `QueryTypes`, and
+the remaining keys are its arguments, e.g.
+
+    {"query": "saturation_time", "mag": [9, 10, 11], "skylevel": "bright"}
+
+Every query except "ping" takes an "instrument" key naming one of
+`Instrument.Profiles`, which defaults to NGTS.
+
+Usage:
+    python NoiseDaemon.py [--socket /tmp/noisedaemon.sock | --port 5900]
+'''
+
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import stat
+import sys
+import numpy as np
+
+import Instrument
+import NoiseModel
+from fits import Fits
+from ErrorContributions import saturation_time, saturation_magnitude
+
+logger = logging.getLogger('NoiseDaemon')
+
+DefaultSocket = '/tmp/noisedaemon.sock'
+
+
+class NoiseQueries(object):
+    '''
+    The queries the daemon answers, with everything they need
+    loaded up front
+    '''
+    def __init__(self):
+        super(NoiseQueries, self).__init__()
+        fits = Fits()
+        self.fits = {'dark': fits['dark'], 'bright': fits['bright']}
+
+    def sky(self, profile, skylevel):
+        '''
+        Sky levels can be given by name or in electrons per second
+        per pixel
+        '''
+        if isinstance(skylevel, str):
+            return Instrument.sky_level(profile, skylevel)
+        return np.asarray(skylevel, dtype=float)
+
+    def noise(self, mag, exptime, airmass=1.3, skylevel='dark',
+            totaltime=3600., darklevel=0.6, scintillation_method=None,
+            instrument='ngts', jitter_rms=None):
+        profile = Instrument.get_profile(instrument)
+        noise = NoiseModel.profile_noise(profile, mag, exptime, airmass,
+                self.sky(profile, skylevel), totaltime, darklevel,
+                scintillation_method, jitter_rms)
+        return dict(noise._asdict())
+
+    def precision(self, exptime, airmass=1.3, skylevel='dark',
+            totaltime=3600., darklevel=0.6, scintillation_method=None,
+            target=1E-3, instrument='ngts', jitter_rms=None):
+        profile = Instrument.get_profile(instrument)
+        logexptime = np.log10(exptime)
+        return {
+                'crosspoint': NoiseModel.profile_crosspoint(profile, target,
+                    exptime, airmass, self.sky(profile, skylevel), totaltime,
+                    darklevel, scintillation_method, jitter_rms),
+                'darklimit': self.fits['dark'](logexptime),
+                'brightlimit': self.fits['bright'](logexptime),
+                }
+
+    def saturation_time(self, mag, skylevel='dark', airmass=1.,
+            central_fraction=None, max_exptime=np.inf, instrument='ngts'):
+        profile = Instrument.get_profile(instrument)
+        return saturation_time(mag, self.sky(profile, skylevel), airmass,
+                central_fraction=central_fraction, max_exptime=max_exptime,
+                profile=profile)
+
+    def saturation_magnitude(self, exptime, skylevel='dark', airmass=1.,
+            central_fraction=None, instrument='ngts'):
+        profile = Instrument.get_profile(instrument)
+        return saturation_magnitude(exptime, self.sky(profile, skylevel),
+                airmass, central_fraction=central_fraction, profile=profile)
+
+    def ping(self):
+        return 'pong'
+
+    def answer(self, query):
+        '''
+        Returns the JSON serialisable answer to a single query
+        '''
+        try:
+            arguments = dict(query)
+            name = arguments.pop('query')
+        except (TypeError, ValueError, KeyError):
+            return {'error': 'Each query must be an object with a "query" key'}
+
+        if name not in QueryTypes:
+            return {'error': 'Unknown query: {}'.format(name)}
+
+        try:
+            return {'result': _serialisable(getattr(self, name)(**arguments))}
+        except (TypeError, ValueError, RuntimeError) as err:
+            return {'error': str(err)}
+
+
+QueryTypes = ['noise', 'precision', 'saturation_time',
+        'saturation_magnitude', 'ping']
+
+
+def _serialisable(value):
+    if isinstance(value, dict):
+        return dict((key, _serialisable(item)) for (key, item) in value.items())
+    elif isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+    '''
+    Answers newline separated requests until the client disconnects
+    '''
+    def setup(self):
+        if self.server.address_family == socket.AF_INET:
+            self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        socketserver.StreamRequestHandler.setup(self)
+
+    def handle(self):
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = {'error': 'Invalid JSON'}
+            else:
+                if isinstance(request, list):
+                    response = [self.server.queries.answer(query)
+                            for query in request]
+                else:
+                    response = self.server.queries.answer(request)
+
+            self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class UnixNoiseServer(socketserver.ThreadingMixIn,
+        socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TCPNoiseServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def remove_stale_socket(socket_path):
+    '''
+    Removes the unix socket at `socket_path` if it is left over from a
+    daemon which has stopped. Raises RuntimeError if a daemon is still
+    listening on it, or if the path is not a socket.
+    '''
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise RuntimeError("{} exists and is not a socket".format(
+            socket_path))
+
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except ConnectionRefusedError:
+        logger.info('Removing stale socket {}'.format(socket_path))
+        os.remove(socket_path)
+    else:
+        raise RuntimeError("A noise daemon is already listening on "
+                "{}".format(socket_path))
+    finally:
+        probe.close()
+
+
+def make_server(socket_path=None, port=None):
+    '''
+    Creates a server on a unix socket, or on a localhost port if given.
+    Raises RuntimeError if it cannot listen there, e.g. the port is in
+    use.
+    '''
+    if port is not None:
+        address = '127.0.0.1:{}'.format(port)
+    else:
+        socket_path = socket_path or DefaultSocket
+        address = socket_path
+        remove_stale_socket(socket_path)
+
+    try:
+        if port is not None:
+            server = TCPNoiseServer(('127.0.0.1', port), QueryHandler)
+        else:
+            server = UnixNoiseServer(socket_path, QueryHandler)
+    except OSError as e:
+        raise RuntimeError("Cannot listen on {}: {}".format(address,
+            e.strerror or e))
+
+    server.queries = NoiseQueries()
+    return server
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-s', '--socket', help='Unix socket path',
+            default=DefaultSocket, required=False)
+    parser.add_argument('-p', '--port', help='Listen on this localhost port '
+            'instead of a unix socket', type=int, required=False, default=None)
+    args = parser.parse_args()
+
+    try:
+        server = make_server(args.socket, args.port)
+    except RuntimeError as e:
+        print("Error:", e, file=sys.stderr)
+        sys.exit(1)
+    logger.info('Listening on {}'.format(server.server_address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.port is None and os.path.exists(args.socket):
+            os.remove(args.socket)
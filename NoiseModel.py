@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+
+'''
+Array based noise model
+
+Evaluates the binned fractional error contributions (source, sky, read,
+dark, scintillation and pointing jitter) for any broadcastable combination of magnitude,
+exposure time, airmass and sky level in a single call, replacing the
+per magnitude `AstErrors.ErrorContribution` objects.
+
+All of the contributions are fractional errors after binning the
+individual exposures up to the target integration time, and are added
+in quadrature for the total.
+'''
+
+from collections import namedtuple
+import numpy as np
+import Instrument
+import JitterNoise
+
+NoiseContributions = namedtuple('NoiseContributions',
+        ['source', 'sky', 'read', 'dark', 'scintillation', 'jitter',
+            'total'])
+
+# Scale height of the atmospheric turbulence (m)
+ScaleHeight = 8000.
+
+# Median scintillation correction factor for Paranal (Osborn et al. 2015)
+OsbornCorrection = 1.56
+
+
+def young_scintillation(exptime, airmass, height, apsize):
+    '''
+    Fractional scintillation error per exposure using Young's
+    approximation, converted from magnitudes to a fraction
+    '''
+    mscin = (0.004 * apsize ** (-2. / 3.) * airmass ** (7. / 4.)
+            * np.exp(-height / ScaleHeight) * (2. * exptime) ** (-1. / 2.))
+    return 1. - (10 ** (-mscin / 2.5))
+
+
+def osborn_scintillation(exptime, airmass, height, apsize):
+    '''
+    Fractional scintillation error per exposure using Young's
+    approximation with the empirical correction from Osborn et al. 2015
+    '''
+    variance = (1E-5 * OsbornCorrection ** 2 * apsize ** (-4. / 3.)
+            * airmass ** 3 * np.exp(-2. * height / ScaleHeight) / exptime)
+    return np.sqrt(variance)
+
+
+# Site and photometry parameters for NGTS, with a 3 pixel radius
+# extraction aperture and the zero point for a 1 second exposure
+NGTSParameters = Instrument.NGTS.parameters
+
+
+ScintillationMethods = {
+        'young': young_scintillation,
+        'osborn': osborn_scintillation,
+        }
+
+
+def noise_contributions(mag, exptime, airmass, skypersecperpix, npix,
+        readtime, extinction, targettime, height, apsize, zp, readnoise,
+        darklevel=0., scintillation_method='osborn', jitter=0.):
+    '''
+    Returns the binned fractional error contributions
+
+    The first four arguments can be scalars or arrays and are broadcast
+    against each other, so e.g. passing `mag[:, None]` and `exptime[None, :]`
+    returns a 2d grid of every contribution.
+
+    `skypersecperpix` and `darklevel` are in electrons per second per pixel,
+    `readnoise` is in electrons per pixel and `zp` is the zero point for a 1
+    second exposure. The instrument parameters and `scintillation_method`
+    can also be arrays which broadcast against the rest, to compare
+    instruments (see `profile_noise`). `jitter` is the fractional flux
+    scatter per exposure from pointing jitter (see `JitterNoise`), and
+    broadcasts against `exptime`.
+    '''
+    mag, exptime, airmass, skypersecperpix = np.broadcast_arrays(
+            *[np.asarray(value, dtype=float) for value in
+                [mag, exptime, airmass, skypersecperpix]])
+
+    methods = np.asarray(scintillation_method)
+    for method in np.unique(methods):
+        if method not in ScintillationMethods:
+            raise RuntimeError("Invalid scintillation method: {}".format(
+                method))
+
+    # Number of exposures binned together
+    nexposures = targettime / (exptime + readtime)
+
+    # Source counts per exposure, after correcting for airmass
+    sourcecounts = 10 ** ((zp - (mag + extinction * airmass)) / 2.5) * exptime
+    binnedflux = sourcecounts * nexposures
+
+    source = np.sqrt(binnedflux) / binnedflux
+    sky = np.sqrt(skypersecperpix * npix * exptime * nexposures) / binnedflux
+    read = readnoise * np.sqrt(npix) * np.sqrt(nexposures) / binnedflux
+    dark = np.sqrt(darklevel * npix * exptime * nexposures) / binnedflux
+
+    # Scintillation is a fraction of the source counts per exposure, so
+    # adding in quadrature when binning reduces it by sqrt(N)
+    if methods.ndim == 0:
+        scintillation = ScintillationMethods[str(methods)](exptime, airmass,
+                height, apsize)
+    else:
+        scintillation = sum(np.where(methods == method,
+            ScintillationMethods[method](exptime, airmass, height, apsize), 0.)
+            for method in np.unique(methods))
+    scintillation = scintillation / np.sqrt(nexposures)
+
+    # Independent between exposures, so binned the same way
+    jitter = np.asarray(jitter, dtype=float) / np.sqrt(nexposures)
+
+    total = np.sqrt(source ** 2 + sky ** 2 + read ** 2 + dark ** 2 +
+            scintillation ** 2 + jitter ** 2)
+
+    return NoiseContributions(source, sky, read, dark, scintillation, jitter,
+            total)
+
+
+def crosspoint(target, exptime, airmass, skypersecperpix, npix, readtime,
+        extinction, targettime, height, apsize, zp, readnoise, darklevel=0.,
+        scintillation_method='osborn', jitter=0., maglimits=(0., 30.),
+        tolerance=1E-6):
+    '''
+    Returns the magnitude at which the total binned fractional error
+    reaches `target`, e.g. 1E-3 for the 1 mmag point
+
+    The total error increases monotonically with magnitude, so the crossing
+    point is found by bisection within `maglimits`, for every (broadcast)
+    exposure time, airmass and sky level at once. The result is accurate to
+    `tolerance` magnitudes, and is nan where the target is not reached
+    within `maglimits`, e.g. when it is below the scintillation floor.
+    '''
+    def total(mag):
+        return noise_contributions(mag, exptime, airmass, skypersecperpix,
+                npix, readtime, extinction, targettime, height, apsize, zp,
+                readnoise, darklevel, scintillation_method, jitter).total
+
+    shape = np.broadcast(*[np.asarray(value) for value in
+        [exptime, airmass, skypersecperpix, npix, readtime, extinction,
+            targettime, height, apsize, zp, readnoise, darklevel,
+            scintillation_method, jitter]]).shape
+    low = np.full(shape, float(maglimits[0]))
+    high = np.full(shape, float(maglimits[1]))
+    bracketed = (total(low) <= target) & (total(high) >= target)
+
+    niterations = int(np.ceil(np.log2((high.max() - low.min()) / tolerance)))
+    for i in range(niterations):
+        middle = 0.5 * (low + high)
+        below = total(middle) < target
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+
+    return np.where(bracketed, 0.5 * (low + high), np.nan)
+
+
+def _profile_arguments(profile, exptime, airmass, skylevel, targettime):
+    profile = Instrument.get_profile(profile)
+    if targettime is None:
+        targettime = profile.target_bintime
+    return (exptime, airmass, Instrument.sky_level(profile, skylevel),
+            profile.npix, profile.read_time, profile.extinction, targettime,
+            profile.height, profile.apsize, profile.zp, profile.read_noise)
+
+
+def profile_noise(profile, mag, exptime, airmass, skylevel,
+        targettime=None, darklevel=0., scintillation_method=None,
+        jitter_rms=None):
+    '''
+    `noise_contributions` for an `Instrument.InstrumentProfile` (or its
+    name), or for several at once with an `Instrument.ProfileStack`
+
+    `skylevel` is a value or "dark"/"bright" for the profile's sky, and
+    `targettime`, `scintillation_method` and `jitter_rms` (pixels, 0 for
+    no jitter term) default to the profile's.
+    '''
+    if scintillation_method is None:
+        scintillation_method = Instrument.get_profile(
+                profile).scintillation_method
+    return noise_contributions(mag, *_profile_arguments(profile, exptime,
+        airmass, skylevel, targettime), darklevel=darklevel,
+        scintillation_method=scintillation_method,
+        jitter=JitterNoise.profile_jitter_noise(profile, exptime, jitter_rms))
+
+
+def profile_crosspoint(profile, target, exptime, airmass, skylevel,
+        targettime=None, darklevel=0., scintillation_method=None,
+        jitter_rms=None, **kwargs):
+    '''
+    `crosspoint` for a profile or `Instrument.ProfileStack`, see
+    `profile_noise`
+    '''
+    if scintillation_method is None:
+        scintillation_method = Instrument.get_profile(
+                profile).scintillation_method
+    return crosspoint(target, *_profile_arguments(profile, exptime, airmass,
+        skylevel, targettime), darklevel=darklevel,
+        scintillation_method=scintillation_method,
+        jitter=JitterNoise.profile_jitter_noise(profile, exptime, jitter_rms),
+        **kwargs)
@@ -12,12 +12,13 @@ import sys
 #import os
 #import os.path
 import argparse
+import logging
 #from subprocess import Popen, call, PIPE, STDOUT
 #import matplotlib.pyplot as plt
 import numpy as np
 #import pyfits
-from Config import *
-import AstErrors as ae
+from Config import TargetBinTime
+import Instrument
 #from ppgplot import *
 
 
@@ -49,8 +50,8 @@ class App(object):
         if self.exptime <= 0.:
             raise RuntimeError("Exposure time cannot be <= 0")
 
-        # Detector object
-        self.NGTSDetector = ae.NGTSDetector()
+        # Detector
+        self.detector = Instrument.NGTS
 
         # Number of bias/dark frames per day
         # These can be taken during the day so dark time is not needed
@@ -107,7 +108,7 @@ class App(object):
 
     def doCalculation(self):
         #self.readtime = self.NGTSDetector.readTime()
-        self.readtime = ReadTime
+        self.readtime = Instrument.NGTS.read_time
 
 
 
@@ -170,7 +171,10 @@ class App(object):
         print("Calculated observable hours: %d" % (self.nOpenHours,))
         print("Simulating for %d telescopes" % (self.nTelescopes,))
         print("Each image is %.1fMB" % (self.imageSize,))
-        print("%s" % (self.NGTSDetector,))
+        print("Detector: %dx%d pixels, %.1f MHz readout, %.1f us vertical "
+                "shift" % (self.detector.naxis1, self.detector.naxis2,
+                    self.detector.horizontal_speed / 1E6,
+                    self.detector.vertical_time * 1E6))
 
         print() 
         Banner("Calculation")
@@ -200,6 +204,7 @@ class App(object):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     try:
         helpstr = """This program calculates the number of images required to 
         store the NGTS raw data, including the calibration frames and
@@ -8,21 +8,35 @@ given size as the psf is moved away from the centre pixel
 '''
 
 import sys
-from jg.subs import progressbarClass
+import time
 import argparse
-from scipy.integrate import dblquad
+import logging
+from functools import partial
 import numpy as np
-from Config import *
+from Config import FWHM
 import matplotlib.pyplot as plt
 import tables
+from PSFFraction import central_fraction
+from Sampling import Samplers, standard_error
+from Streaming import StreamingHistogram, StreamingSummary
+from MonteCarlo import MonteCarloRunner
 
-def Gaussian2D(y, x, fwhm, offset):
-    sigma = fwhm / 2.35
-    arg1 = (x-offset[0])**2
-    arg2 = (y - offset[1])**2
-    return np.exp(-(arg1 + arg2) / (2. * sigma**2))
+logger = logging.getLogger('OffsetDistribution')
 
 
+def offset_fractions(fwhm, xRange, yRange, nbins, histRange, points):
+    '''
+    Accumulates the central pixel fractions for psf offsets at `points`
+    in the unit square, scaled to the offset ranges
+    '''
+    x = (xRange[1] - xRange[0]) * points[:, 0] + xRange[0]
+    y = (yRange[1] - yRange[0]) * points[:, 1] + yRange[0]
+
+    # Fraction of the offset Gaussian in the centre pixel
+    fractions = central_fraction(fwhm, x, y)
+    return (StreamingSummary((0., 1.)).update(fractions),
+            StreamingHistogram(nbins, histRange).update(np.log10(fractions)))
+
 
 class App(object):
     """docstring for App"""
@@ -35,49 +49,80 @@ class App(object):
         self.xRange = [-0.5, 0.5]
         self.yRange = [-0.5, 0.5]
 
+        # Histogram of the log fractions
+        self.nbins = 50
+        self.histRange = (-1, 0)
 
-        self.run()
 
-    def Integrate(self, lims, offset):
-        return dblquad(Gaussian2D, lims[0], lims[1], lambda x: lims[2], lambda x: lims[3], args=(self.fwhm, offset))
+        self.run()
 
+    def sample(self):
+        '''
+        Draws offsets in batches, doubling in size, until the standard
+        errors of the median and of every normalised histogram bin are below
+        the tolerance, or the sample limit is reached. The errors come from
+        the spread between independent replicates.
+
+        The fractions are not kept: each replicate accumulates a
+        `StreamingSummary` of the fractions and a `StreamingHistogram` of
+        their logs, so memory does not grow with the number of samples.
+        The batches are spread over `--processes` workers by a
+        `MonteCarloRunner`, with the same results for any number of them.
+        Returns the summary and histogram merged over the replicates.
+        '''
+        with MonteCarloRunner(partial(offset_fractions, self.fwhm,
+                self.xRange, self.yRange, self.nbins, self.histRange), 2,
+                sampler=self.args.sampler, replicates=self.args.replicates,
+                seed=self.args.seed, processes=self.args.processes) as runner:
+            self.entropy = runner.entropy
+            logger.info('Seed entropy {:d}'.format(self.entropy))
+
+            batch = self.args.batch
+            while True:
+                results = runner.advance(batch)
+                self.nsamples = runner.nsamples
+
+                self.medianError = standard_error([summary.median()
+                    for (summary, histogram) in results])
+                self.histogramError = standard_error([histogram.normalised()
+                    for (summary, histogram) in results]).max()
+                logger.info('{:d} samples, median error {:.2g}, histogram '
+                        'error {:.2g}'.format(self.nsamples, self.medianError,
+                            self.histogramError))
+
+                self.converged = max(self.medianError,
+                        self.histogramError) < self.args.tolerance
+                batch *= 2
+                if (self.converged or
+                        self.nsamples + batch * len(results) > self.N):
+                    break
+
+            return runner.merged()
 
     def run(self):
-        # The total integral of a 2d Gaussian to infinity in each direction
-        total = self.Integrate((-np.Inf, np.Inf, -np.Inf, np.Inf), (0., 0.))[0]
-
-        fractions = []
-        pb = progressbarClass(self.N)
-        counter = 0
-
-
-        # Main loop
-        while counter < self.N:
-            # Pick two random coordinates
-            x = (self.xRange[1] - self.xRange[0]) * np.random.ranf() + self.xRange[0]
-            y = (self.yRange[1] - self.yRange[0]) * np.random.ranf() + self.yRange[0]
-
-
-
-
-            # Integrate the new offset Gaussian in the centre pixel and take the fraction
-            Fraction = self.Integrate((-0.5, 0.5, -0.5, 0.5), (x, y))[0] / total
-
-            # Add the result to the list
-            fractions.append(Fraction)
-            pb.progress(counter+1)
-            counter += 1
-
-        med_val = np.median(fractions)
-        med_val_err = np.std(fractions)
-
-        # Log the fractions
+        start = time.time()
+        summary, histogram = self.sample()
+        logger.info('{:d} samples in {:.2f}s'.format(self.nsamples,
+            time.time() - start))
+
+        if not self.converged:
+            logger.warning('Tolerance of {:g} not reached within {:d} '
+                    'samples'.format(self.args.tolerance, self.N))
+        if summary.nan:
+            logger.warning('{:d} samples gave nan fractions and were left '
+                    'out'.format(summary.nan))
+
+        med_val = summary.median()
+        med_val_err = summary.std
+        print("Median fraction: %f +/- %.2g (standard error)" % (med_val,
+            self.medianError))
+        print("Histogram error: %.2g" % self.histogramError)
+        print("%d %s samples, %s" % (self.nsamples, self.args.sampler,
+            "converged" if self.converged else "not converged"))
+
+        # Histogram of the log fractions
         # Makes the plot easier to read
-        fractions = np.log10(fractions)
-
-
-        # Create the histogram
-        vals, edges = np.histogram(fractions, bins=50, range=(-1, 0))
+        vals, edges = histogram.counts, histogram.edges
 
         # Counting errors
         errs = np.sqrt(vals)
@@ -125,6 +170,11 @@ class App(object):
             outfile.create_array('/', 'y', normalisedVals)
             outfile.root._v_attrs.most_probable = med_val
             outfile.root._v_attrs.sd = med_val_err
+            outfile.root._v_attrs.median_error = self.medianError
+            outfile.root._v_attrs.histogram_error = self.histogramError
+            outfile.root._v_attrs.nsamples = self.nsamples
+            outfile.root._v_attrs.sampler = self.args.sampler
+            outfile.root._v_attrs.seed_entropy = str(self.entropy)
 
         plt.show()
 
@@ -132,11 +182,28 @@ class App(object):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument("-d", "--device", help="PGPLOT device",
             required=False, type=str, default="1/xs")
-    parser.add_argument("-N", "--niter", help="Number of iterations (use > 5000)",
-            required=False, type=int, default=5000)
+    parser.add_argument("-N", "--niter", help="Maximum number of samples",
+            required=False, type=int, default=10000000)
+    parser.add_argument("--sampler", help="Offset sampler (default sobol)",
+            choices=Samplers, default='sobol', required=False)
+    parser.add_argument("--tolerance", help="Standard error at which to "
+            "stop, for the median and each normalised histogram bin",
+            type=float, default=1E-4, required=False)
+    parser.add_argument("--replicates", help="Independent replicates used "
+            "to estimate the errors", type=int, default=8, required=False)
+    parser.add_argument("--batch", help="Samples per replicate in the first "
+            "batch (a power of 2 for sobol)", type=int, default=4096,
+            required=False)
+    parser.add_argument("--seed", help="Random seed (default: fresh "
+            "entropy, which is logged and saved)", type=int, default=None,
+            required=False)
+    parser.add_argument('-j', '--processes', help='Number of processes '
+            '(default: number of cores)', type=int, required=False,
+            default=None)
     args = parser.parse_args()
     app = App(args)
 
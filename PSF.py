@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+
+'''
+Pixel integrated point spread functions
+
+`GaussianPSF`, `MoffatPSF` and `ImagePSF` (a supersampled image, e.g. an
+empirical NGTS psf) share one pixelisation: the psf is sampled on a grid
+of `supersample` subpixels per pixel, box filtered with a one pixel
+window (by cumulative sums, or FFT convolution), and the filtered image
+read at every pixel centre for each of the (`supersample` + 1)^2 offsets
+of the psf centre which line up with the subpixel grid. These pixelised
+kernels are cached per psf and grid, and any offset within the central
+pixel is interpolated bilinearly between them, so thousands of offsets
+cost a few array operations.
+
+Offsets are the psf centre relative to the centre of the central pixel,
+in pixels, and footprints are indexed [y, x] with the central pixel at
+[halfwidth, halfwidth].
+'''
+
+from collections import OrderedDict
+import numpy as np
+from ResultStore import canonical_hash
+import PSFFraction
+
+# Pixelised kernels kept in memory
+KernelCacheSize = 32
+_kernels = OrderedDict()
+
+
+class PixelKernels(object):
+    '''
+    Pixel fractions of the (2 * `halfwidth` + 1) square footprint for the
+    psf centre at each point of `offsets` along each axis
+    '''
+    def __init__(self, offsets, kernels):
+        super(PixelKernels, self).__init__()
+        self.offsets = offsets
+        self.kernels = kernels
+        self.halfwidth = kernels.shape[-1] // 2
+
+    def __call__(self, dx=0., dy=0.):
+        '''
+        Footprints for each (broadcast) offset, which must lie within the
+        central pixel
+        '''
+        dx, dy = np.broadcast_arrays(np.asarray(dx, dtype=float),
+                np.asarray(dy, dtype=float))
+        if (np.abs(dx) > 0.5 + 1E-9).any() or (np.abs(dy) > 0.5 + 1E-9).any():
+            raise ValueError("Offsets must be within the central pixel")
+
+        step = self.offsets[1] - self.offsets[0]
+        nsteps = self.offsets.size - 1
+
+        def weights(values):
+            position = (values - self.offsets[0]) / step
+            index = np.clip(np.floor(position).astype(int), 0, nsteps - 1)
+            return index, np.clip(position - index, 0., 1.)[..., None, None]
+
+        i, wi = weights(dy)
+        j, wj = weights(dx)
+        k = self.kernels
+        return ((k[i, j] * (1. - wj) + k[i, j + 1] * wj) * (1. - wi) +
+                (k[i + 1, j] * (1. - wj) + k[i + 1, j + 1] * wj) * wi)
+
+
+def _box_filter(image, width, method):
+    '''
+    Sum of every `width` square window of `image`
+    '''
+    if method == 'fft':
+        from scipy.signal import fftconvolve
+        return fftconvolve(image, np.ones((width, width)), mode='valid')
+    elif method == 'bin':
+        total = np.zeros((image.shape[0] + 1, image.shape[1] + 1))
+        total[1:, 1:] = image.cumsum(axis=0).cumsum(axis=1)
+        return (total[width:, width:] - total[:-width, width:] -
+                total[width:, :-width] + total[:-width, :-width])
+    raise ValueError("Unknown pixelisation method: {}".format(method))
+
+
+class PSF(object):
+    '''
+    Base class: subclasses provide `key`, identifying the psf for the
+    kernel cache, and `supersampled`, the flux in each subpixel
+    '''
+    # Default subpixels per pixel
+    supersample = 10
+
+    def key(self):
+        raise NotImplementedError
+
+    def supersampled(self, extent, supersample):
+        '''
+        Flux in each subpixel of the square from -`extent` to `extent`
+        pixels, with the psf centred at the origin
+        '''
+        raise NotImplementedError
+
+    def kernels(self, halfwidth=3, supersample=None, method='bin'):
+        '''
+        The (cached) `PixelKernels` for this psf
+        '''
+        supersample = supersample or self.supersample
+        cache_key = canonical_hash(self.key(), halfwidth, supersample, method)
+        if cache_key in _kernels:
+            _kernels.move_to_end(cache_key)
+            return _kernels[cache_key]
+
+        # One pixel margin so the window can move a full pixel
+        extent = halfwidth + 1
+        fine = self.supersampled(extent, supersample)
+        boxed = _box_filter(fine, supersample, method)
+
+        # Starting the windows `phase` subpixels in moves the pixel grid by
+        # phase / supersample, i.e. the psf by 0.5 - phase / supersample
+        # relative to the pixel centres. Reverse so offsets ascend.
+        npix = 2 * halfwidth + 1
+        phases = np.arange(supersample + 1)[::-1]
+        index = phases[:, None] + supersample * np.arange(npix)[None, :]
+        kernels = boxed[index[:, None, :, None], index[None, :, None, :]]
+        offsets = 0.5 - phases / float(supersample)
+
+        result = PixelKernels(offsets, kernels)
+        _kernels[cache_key] = result
+        while len(_kernels) > KernelCacheSize:
+            _kernels.popitem(last=False)
+        return result
+
+    def pixel_fractions(self, dx=0., dy=0., halfwidth=3, **kwargs):
+        return self.kernels(halfwidth, **kwargs)(dx, dy)
+
+    def central_fraction(self, dx=0., dy=0., **kwargs):
+        return self.kernels(0, **kwargs)(dx, dy)[..., 0, 0]
+
+    def peak_fraction(self, dx=0., dy=0., **kwargs):
+        '''
+        Fraction in the pixel containing the psf centre, so any offset can
+        be given
+        '''
+        dx, dy = np.asarray(dx, dtype=float), np.asarray(dy, dtype=float)
+        return self.central_fraction(dx - np.round(dx), dy - np.round(dy),
+                **kwargs)
+
+    def typical_central_fraction(self, nsamples=100, **kwargs):
+        '''
+        Median central pixel fraction for psf centres spread uniformly
+        over the pixel
+        '''
+        samples = (np.arange(nsamples) + 0.5) / nsamples - 0.5
+        return float(np.median(self.central_fraction(samples[:, None],
+            samples[None, :], **kwargs)))
+
+    def aperture_fraction(self, radius, dx=0., dy=0., halfwidth=None,
+            **kwargs):
+        '''
+        Fraction of the flux in the pixels whose centres are within
+        `radius` pixels of the central pixel centre
+        '''
+        if halfwidth is None:
+            halfwidth = int(np.ceil(radius))
+        footprint = self.pixel_fractions(dx, dy, halfwidth, **kwargs)
+        pixels = np.arange(-halfwidth, halfwidth + 1)
+        mask = pixels[:, None] ** 2 + pixels[None, :] ** 2 <= radius ** 2
+        return (footprint * mask).sum(axis=(-2, -1))
+
+
+def _subpixel_centres(extent, supersample):
+    n = 2 * extent * supersample
+    return -extent + (np.arange(n) + 0.5) / float(supersample)
+
+
+class AnalyticPSF(PSF):
+    '''
+    Circularly symmetric psf with a normalised surface brightness
+    `profile(r2)` for squared radius `r2`
+    '''
+    def supersampled(self, extent, supersample):
+        x = _subpixel_centres(extent, supersample)
+        return self.profile(x[:, None] ** 2 + x[None, :] ** 2) / float(
+                supersample) ** 2
+
+
+class GaussianPSF(AnalyticPSF):
+    def __init__(self, fwhm):
+        super(GaussianPSF, self).__init__()
+        self.fwhm = float(fwhm)
+        self.sigma = self.fwhm / PSFFraction.FWHMToSigma
+
+    def key(self):
+        return ['gaussian', self.fwhm]
+
+    def profile(self, r2):
+        return np.exp(-0.5 * r2 / self.sigma ** 2) / (2. * np.pi *
+                self.sigma ** 2)
+
+
+class MoffatPSF(AnalyticPSF):
+    '''
+    Moffat psf, with wings which fall off as r^(-2 beta)
+    '''
+    def __init__(self, fwhm, beta=2.5):
+        super(MoffatPSF, self).__init__()
+        if beta <= 1.:
+            raise ValueError("Moffat beta must be greater than 1")
+        self.fwhm = float(fwhm)
+        self.beta = float(beta)
+        self.alpha = self.fwhm / (2. * np.sqrt(2. ** (1. / self.beta) - 1.))
+
+    def key(self):
+        return ['moffat', self.fwhm, self.beta]
+
+    def profile(self, r2):
+        return ((self.beta - 1.) / (np.pi * self.alpha ** 2) *
+                (1. + r2 / self.alpha ** 2) ** -self.beta)
+
+
+class ImagePSF(PSF):
+    '''
+    Psf from an image with `supersample` subpixels per pixel, centred on
+    the centre of the image. The image is normalised to a total flux of 1,
+    and must have an even number of subpixels per side so that its centre
+    falls on a subpixel corner.
+    '''
+    def __init__(self, image, supersample):
+        super(ImagePSF, self).__init__()
+        image = np.asarray(image, dtype=float)
+        if image.ndim != 2 or image.shape[0] != image.shape[1]:
+            raise ValueError("PSF images must be square")
+        if image.shape[0] % 2:
+            raise ValueError("PSF images must have an even number of "
+                    "subpixels per side")
+        self.image = image / image.sum()
+        self.supersample = int(supersample)
+
+    @classmethod
+    def from_file(cls, filename, supersample):
+        '''
+        Loads an image saved with `numpy.save`
+        '''
+        return cls(np.load(filename), supersample)
+
+    def key(self):
+        return ['image', self.image, self.supersample]
+
+    def supersampled(self, extent, supersample):
+        if supersample != self.supersample:
+            raise ValueError("Image psfs can only be pixelised at their own "
+                    "supersampling ({})".format(self.supersample))
+
+        # Crop or pad the image to the requested extent
+        size = 2 * extent * supersample
+        margin = (self.image.shape[0] - size) // 2
+        if margin >= 0:
+            return self.image[margin:margin + size, margin:margin + size]
+        return np.pad(self.image, -margin, mode='constant')
+
+
+def make_psf(kind, fwhm, beta=2.5, supersample=10):
+    '''
+    Returns the psf for a command line `--psf` option: "gaussian",
+    "moffat", or the filename of a supersampled psf image
+    '''
+    if kind == 'gaussian':
+        return GaussianPSF(fwhm)
+    elif kind == 'moffat':
+        return MoffatPSF(fwhm, beta)
+    return ImagePSF.from_file(kind, supersample)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+
+'''
+Fraction of a Gaussian psf falling within a pixel
+
+A circular Gaussian is separable, so its integral over a pixel is the
+product of two one dimensional integrals, each a difference of error
+functions, and the integral over the whole plane is 1. This replaces the
+`dblquad` integrations in `OffsetDistribution.py` and
+`FractionVsCentre.py`, and every function takes arrays of fwhm and offsets
+which are broadcast against each other.
+
+Offsets are the position of the psf centre relative to the centre of
+pixel (0, 0), in pixels, and the fwhm is in pixels.
+'''
+
+import numpy as np
+from scipy.special import erf
+
+# Conversion from fwhm to sigma, as used by `Gaussian2D` in the scripts
+FWHMToSigma = 2.35
+
+
+def interval_fraction(low, high, sigma):
+    '''
+    Fraction of a one dimensional Gaussian, centred on 0, between `low`
+    and `high`
+    '''
+    scale = np.sqrt(2.) * np.asarray(sigma, dtype=float)
+    return 0.5 * (erf(np.asarray(high) / scale) - erf(np.asarray(low) / scale))
+
+
+def pixel_fraction(fwhm, dx=0., dy=0., pixel=(0, 0)):
+    '''
+    Fraction of the flux of a psf with centre offset (`dx`, `dy`) which
+    falls in `pixel`, given as (x, y) pixel indices relative to the
+    central pixel
+    '''
+    sigma = np.asarray(fwhm, dtype=float) / FWHMToSigma
+    dx, dy = np.asarray(dx, dtype=float), np.asarray(dy, dtype=float)
+    i, j = pixel
+    return (interval_fraction(i - 0.5 - dx, i + 0.5 - dx, sigma) *
+            interval_fraction(j - 0.5 - dy, j + 0.5 - dy, sigma))
+
+
+def central_fraction(fwhm, dx=0., dy=0.):
+    '''
+    Fraction of the flux in the central pixel
+    '''
+    return pixel_fraction(fwhm, dx, dy)
+
+
+def peak_fraction(fwhm, dx=0., dy=0.):
+    '''
+    Fraction of the flux in the brightest pixel, the one containing the
+    psf centre
+    '''
+    dx, dy = np.asarray(dx, dtype=float), np.asarray(dy, dtype=float)
+    return central_fraction(fwhm, dx - np.round(dx), dy - np.round(dy))
+
+
+def footprint_fractions(fwhm, dx=0., dy=0., halfwidth=2):
+    '''
+    Fractions in every pixel of the (2 * `halfwidth` + 1) square box around
+    the central pixel, with the box as the last two axes, indexed [y, x]
+    '''
+    sigma = np.asarray(fwhm, dtype=float)[..., None] / FWHMToSigma
+    dx = np.asarray(dx, dtype=float)[..., None]
+    dy = np.asarray(dy, dtype=float)[..., None]
+    edges = np.arange(-halfwidth, halfwidth + 1)
+    fx = interval_fraction(edges - 0.5 - dx, edges + 0.5 - dx, sigma)
+    fy = interval_fraction(edges - 0.5 - dy, edges + 0.5 - dy, sigma)
+    return fy[..., :, None] * fx[..., None, :]
@@ -0,0 +1,174 @@
+# -*- coding: utf-8 -*-
+
+'''
+Lookup table of psf pixel fractions
+
+Tabulates the central pixel and peak (brightest) pixel fractions from
+`PSFFraction` over a grid of fwhm and psf offsets, and the median central
+pixel fraction for offsets spread uniformly over the pixel, which is the
+typical value `OffsetDistribution.py` estimates by Monte Carlo. Lookups
+interpolate trilinearly between the grid nodes.
+
+The table is saved under `.psftable/`, named by a hash of the grid, and is
+built automatically the first time it is needed.
+'''
+
+import logging
+import os
+import tempfile
+import zipfile
+import numpy as np
+import PSFFraction
+from ResultStore import canonical_hash
+
+logger = logging.getLogger('PSFTable')
+
+DefaultPath = '.psftable'
+
+# The fractions are symmetric in the sign of each offset, so the offset
+# axes only cover positive values
+DefaultGrid = {
+        'fwhm': np.linspace(0.5, 5., 91),
+        'offset': np.linspace(0., 1.5, 61),
+        }
+
+# Offsets per axis used for the median over the pixel
+MedianSamples = 200
+
+
+def build_table(grid=None):
+    '''
+    Returns the table arrays for `grid`, which can override either axis
+    of `DefaultGrid`
+    '''
+    axes = dict(DefaultGrid)
+    axes.update(grid or {})
+    fwhm = np.asarray(axes['fwhm'], dtype=float)
+    offset = np.asarray(axes['offset'], dtype=float)
+
+    f, dx, dy = np.meshgrid(fwhm, offset, offset, indexing='ij', sparse=True)
+    central = PSFFraction.central_fraction(f, dx, dy)
+    peak = PSFFraction.peak_fraction(f, dx, dy)
+
+    # Cell centres of a regular grid over a quadrant of the pixel sample
+    # uniform offsets over the whole pixel by symmetry
+    samples = (np.arange(MedianSamples) + 0.5) * 0.5 / MedianSamples
+    median = np.array([np.median(PSFFraction.central_fraction(value,
+        samples[:, None], samples[None, :])) for value in fwhm])
+
+    return {'fwhm': fwhm, 'offset': offset, 'central': central,
+            'peak': peak, 'median': median}
+
+
+def _weights(grid, values):
+    '''
+    Lower node index and upper node weight along a uniform `grid`
+    '''
+    values = np.asarray(values, dtype=float)
+    step = grid[1] - grid[0]
+    tolerance = 1E-9 * (grid[-1] - grid[0])
+    if (values < grid[0] - tolerance).any() or (
+            values > grid[-1] + tolerance).any():
+        raise ValueError("Values outside of the table range {} - {}".format(
+            grid[0], grid[-1]))
+
+    position = (values - grid[0]) / step
+    index = np.clip(np.floor(position).astype(int), 0, grid.size - 2)
+    return index, np.clip(position - index, 0., 1.)
+
+
+class PixelFractionTable(object):
+    '''
+    Loads the table for `grid` from `path`, building it if it is missing
+    '''
+    def __init__(self, path=DefaultPath, grid=None):
+        super(PixelFractionTable, self).__init__()
+        axes = dict(DefaultGrid)
+        axes.update(grid or {})
+        key = canonical_hash(axes, PSFFraction.FWHMToSigma, MedianSamples)
+        self.filename = os.path.join(path, 'fractions-{}.npz'.format(key))
+
+        try:
+            with np.load(self.filename) as infile:
+                data = dict(infile)
+        except (IOError, ValueError, zipfile.BadZipFile):
+            logger.info('Building psf fraction table {}'.format(self.filename))
+            data = build_table(grid)
+            self._save(path, data)
+
+        self.fwhm = data['fwhm']
+        self.offset = data['offset']
+        self.tables = {'central': data['central'], 'peak': data['peak']}
+        self.median = data['median']
+
+    def _save(self, path, data):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        handle, tmpname = tempfile.mkstemp(dir=path, suffix='.npz')
+        with os.fdopen(handle, 'wb') as outfile:
+            np.savez(outfile, **data)
+        os.rename(tmpname, self.filename)
+
+    def lookup(self, name, fwhm, dx=0., dy=0.):
+        '''
+        Trilinear interpolation of table `name` ("central" or "peak") at
+        each (broadcast) fwhm and offset
+        '''
+        table = self.tables[name]
+        fwhm, dx, dy = np.broadcast_arrays(*[np.asarray(value, dtype=float)
+            for value in [fwhm, dx, dy]])
+
+        i, wi = _weights(self.fwhm, fwhm)
+        j, wj = _weights(self.offset, np.abs(dx))
+        k, wk = _weights(self.offset, np.abs(dy))
+
+        # Gather the corners from the flattened table, then interpolate
+        # along each axis in turn
+        flat = table.ravel()
+        si, sj = table.shape[1] * table.shape[2], table.shape[2]
+        base = i * si + j * sj + k
+
+        def lerp(low, high, weight):
+            return low + (high - low) * weight
+
+        corners = {}
+        for di in (0, 1):
+            for dj in (0, 1):
+                index = base + di * si + dj * sj
+                corners[di, dj] = lerp(flat[index], flat[index + 1], wk)
+
+        return lerp(lerp(corners[0, 0], corners[0, 1], wj),
+                lerp(corners[1, 0], corners[1, 1], wj), wi)
+
+    def central(self, fwhm, dx=0., dy=0.):
+        return self.lookup('central', fwhm, dx, dy)
+
+    def peak(self, fwhm, dx=0., dy=0.):
+        '''
+        Offsets are taken relative to the nearest pixel centre, so any
+        offset can be given
+        '''
+        dx, dy = np.asarray(dx, dtype=float), np.asarray(dy, dtype=float)
+        return self.lookup('peak', fwhm, dx - np.round(dx), dy - np.round(dy))
+
+    def median_central(self, fwhm):
+        '''
+        Median central pixel fraction for psf centres spread uniformly
+        over the pixel
+        '''
+        fwhm = np.asarray(fwhm, dtype=float)
+        i, wi = _weights(self.fwhm, fwhm)
+        return self.median[i] * (1. - wi) + self.median[i + 1] * wi
+
+
+_default_table = None
+
+
+def default_table():
+    '''
+    The table for the default grid, loaded once per process
+    '''
+    global _default_table
+    if _default_table is None:
+        _default_table = PixelFractionTable()
+    return _default_table
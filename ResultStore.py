@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+'''
+Persistent results for the sweep scripts
+
+Each result is stored in its own file, named by a hash of the inputs
+which produced it, so extending a sweep only computes the new points and
+an interrupted sweep resumes where it stopped. Every store also records a
+hash of the configuration the results depend on; if the configuration
+changes (e.g. a value in `Config.py`) the stale results are removed when
+the store is next opened.
+'''
+
+import hashlib
+import logging
+import os
+import pickle
+import shutil
+import tempfile
+import types
+import numpy as np
+
+logger = logging.getLogger('ResultStore')
+
+DefaultPath = '.resultstore'
+
+
+def _canonical(value):
+    '''
+    Returns a string representation of `value` which is the same for
+    equal values, regardless of e.g. dictionary ordering
+    '''
+    if isinstance(value, dict):
+        return '{' + ','.join('{}:{}'.format(_canonical(key), _canonical(value[key]))
+                for key in sorted(value, key=repr)) + '}'
+    elif isinstance(value, (list, tuple)):
+        return '[' + ','.join(_canonical(item) for item in value) + ']'
+    elif isinstance(value, np.ndarray):
+        value = np.ascontiguousarray(value)
+        return 'array({},{},{})'.format(value.dtype.str, value.shape,
+                hashlib.sha1(value.tobytes()).hexdigest())
+    elif isinstance(value, (float, np.floating)):
+        return repr(float(value))
+    elif isinstance(value, (np.integer, np.bool_)):
+        return repr(value.item())
+    elif hasattr(value, '_asdict'):
+        return type(value).__name__ + _canonical(dict(value._asdict()))
+    return repr(value)
+
+
+def canonical_hash(*values):
+    '''
+    Hash of the canonical representation of `values`
+    '''
+    return hashlib.sha1(_canonical(values).encode('utf-8')).hexdigest()
+
+
+def module_values(module):
+    '''
+    Returns the public settings of a configuration module such as
+    `Config`, i.e. everything except modules, functions and classes
+    '''
+    return dict((name, value) for (name, value) in vars(module).items()
+            if not name.startswith('_') and not isinstance(value,
+                (types.ModuleType, types.FunctionType, type)))
+
+
+def file_hash(filename):
+    '''
+    Hash of the contents of `filename`
+    '''
+    sha = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ResultStore(object):
+    '''
+    Directory of results for one sweep (`namespace`), keyed by a hash of
+    the parameters for each point. `config` is any combination of values
+    the results depend on.
+    '''
+    def __init__(self, namespace, config=None, path=DefaultPath):
+        super(ResultStore, self).__init__()
+        self.path = os.path.join(path, namespace)
+        self.config_hash = canonical_hash(config)
+
+        config_filename = os.path.join(self.path, 'CONFIG')
+        if os.path.isdir(self.path):
+            try:
+                with open(config_filename) as infile:
+                    stored_hash = infile.read().strip()
+            except IOError:
+                stored_hash = None
+
+            if stored_hash != self.config_hash:
+                logger.info('Configuration changed, removing stale results '
+                        'from {}'.format(self.path))
+                shutil.rmtree(self.path)
+
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+            with open(config_filename, 'w') as outfile:
+                outfile.write(self.config_hash)
+
+    def key(self, params):
+        return canonical_hash(params)
+
+    def _filename(self, params):
+        return os.path.join(self.path, self.key(params) + '.pickle')
+
+    def __contains__(self, params):
+        return os.path.isfile(self._filename(params))
+
+    def __len__(self):
+        return len([name for name in os.listdir(self.path)
+            if name.endswith('.pickle')])
+
+    def get(self, params, default=None):
+        try:
+            with open(self._filename(params), 'rb') as infile:
+                return pickle.load(infile)
+        except (IOError, EOFError):
+            return default
+
+    def put(self, params, result):
+        '''
+        Stores `result`, writing to a temporary file first so an
+        interrupted write never leaves a truncated result
+        '''
+        handle, tmpname = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as outfile:
+            pickle.dump(result, outfile, protocol=2)
+        os.rename(tmpname, self._filename(params))
+
+    def clear(self):
+        for name in os.listdir(self.path):
+            if name.endswith('.pickle'):
+                os.remove(os.path.join(self.path, name))
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+'''
+Uniform samplers for the Monte Carlo scripts
+
+Each sampler draws points in the unit hypercube in batches, continuing
+its sequence from one batch to the next. "sobol" and "halton" are
+scrambled quasi-random sequences, which cover the cube more evenly than
+pseudo-random points so estimates converge faster. "random" is plain
+pseudo-random sampling.
+
+Errors are estimated from independent replicates: each has its own
+scrambling (or random stream), from `np.random.SeedSequence.spawn`, so the
+spread of the replicate estimates gives the standard error.
+'''
+
+import numpy as np
+
+Samplers = ['sobol', 'halton', 'random']
+
+
+class RandomSampler(object):
+    def __init__(self, d, seed=None):
+        super(RandomSampler, self).__init__()
+        self.d = d
+        self.rng = np.random.default_rng(seed)
+
+    def random(self, n):
+        return self.rng.random((n, self.d))
+
+    def fast_forward(self, n):
+        '''
+        Skips `n` points, as the scipy quasi-random samplers do. Each
+        coordinate uses one 64 bit draw.
+        '''
+        self.rng.bit_generator.advance(n * self.d)
+        return self
+
+
+def make_sampler(kind, d, seed=None):
+    '''
+    Sampler of `d` dimensional points with a `random(n)` method
+    '''
+    if kind == 'random':
+        return RandomSampler(d, seed)
+
+    from scipy.stats import qmc
+    if kind == 'sobol':
+        return qmc.Sobol(d, scramble=True, seed=np.random.default_rng(seed))
+    elif kind == 'halton':
+        return qmc.Halton(d, scramble=True, seed=np.random.default_rng(seed))
+    raise ValueError("Unknown sampler: {}".format(kind))
+
+
+def make_replicates(kind, d, replicates, seed=None):
+    '''
+    Independent samplers for `replicates` replicates
+    '''
+    return [make_sampler(kind, d, child) for child in
+            np.random.SeedSequence(seed).spawn(replicates)]
+
+
+def standard_error(estimates):
+    '''
+    Standard error of the mean of the replicate estimates, along the
+    first axis
+    '''
+    estimates = np.asarray(estimates, dtype=float)
+    return estimates.std(axis=0, ddof=1) / np.sqrt(estimates.shape[0])
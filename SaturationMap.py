@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+
+'''
+Saturation over the whole psf footprint
+
+The saturation functions in `ErrorContributions` compare the central
+pixel, with the bias and sky of the whole aperture, to the full well
+depth. Here every pixel of the (2 * `halfwidth` + 1) square footprint
+around the star gets its own electrons
+
+    e = bias + (f source + sky) exptime
+
+where f is the fraction of the psf in the pixel, the bias is the level of
+one pixel and the sky is per pixel. A pixel is saturated when it reaches
+the full well depth, and clipped when its counts reach the top of the
+ADC, (2^digitisation - 1) ADU.
+
+Each pixel fills at a constant rate, so it saturates at the time
+
+    t = (limit - bias) / (f source + sky)
+
+`saturation_times` returns these per pixel, and `footprint_saturation`
+compares them to any number of exposure times, so stars and exposure
+times broadcast against each other without building the electrons of
+every pixel for every pair. `footprint_electrons` gives the full map.
+'''
+
+from collections import namedtuple
+import numpy as np
+import Instrument
+import PSFFraction
+
+# Half width of the footprint, in pixels
+DefaultHalfwidth = 3
+
+FootprintSaturation = namedtuple('FootprintSaturation', [
+    'peak',             # electrons in the brightest pixel
+    'full_well',        # any pixel at the full well depth
+    'adc',              # any pixel clipped by the ADC
+    'nfull_well',       # number of pixels at the full well depth
+    'nadc',             # number of pixels clipped by the ADC
+    ])
+
+
+def adc_limit(profile=Instrument.NGTS):
+    '''
+    Electrons in a pixel at the top of the ADC range
+    '''
+    profile = Instrument.get_profile(profile)
+    return (2 ** profile.digitisation - 1) * profile.gain
+
+
+def _footprint(mag, skylevel, airmass, zp, profile, dx, dy, psf,
+        halfwidth):
+    # Source electrons per second, the fractions of the psf in each pixel
+    # of the footprint (as the last two axes) and the sky per pixel
+    if zp is None:
+        from ErrorContributions import ZP
+        zp = ZP(1.)
+    source = 10 ** ((zp - (np.asarray(mag, dtype=float) + profile.extinction
+        * np.asarray(airmass, dtype=float))) / 2.5)
+    if psf is not None:
+        fractions = psf.pixel_fractions(dx, dy, halfwidth)
+    else:
+        fractions = PSFFraction.footprint_fractions(profile.fwhm, dx, dy,
+                halfwidth)
+    sky = np.asarray(Instrument.sky_level(profile, skylevel), dtype=float)
+    return source, fractions, sky
+
+
+def _rates(mag, skylevel, airmass, zp, profile, dx, dy, psf, halfwidth):
+    # Source and sky electrons per second in each pixel of the footprint
+    source, fractions, sky = _footprint(mag, skylevel, airmass, zp, profile,
+            dx, dy, psf, halfwidth)
+    return source[..., None, None] * fractions + sky[..., None, None]
+
+
+def footprint_electrons(mag, exptime, skylevel='dark', airmass=1., zp=None,
+        profile=Instrument.NGTS, dx=0., dy=0., psf=None,
+        halfwidth=DefaultHalfwidth):
+    '''
+    Electrons in each pixel of the footprint, before any saturation, with
+    the footprint as the last two axes, indexed [y, x]. `mag`, `exptime`,
+    `airmass` and the psf offsets `dx`, `dy` broadcast against each other.
+    The psf is a Gaussian of the profile's fwhm unless a `PSF.PSF` is given.
+    '''
+    profile = Instrument.get_profile(profile)
+    rates = _rates(mag, skylevel, airmass, zp, profile, dx, dy, psf,
+            halfwidth)
+    return (profile.bias_level + rates *
+            np.asarray(exptime, dtype=float)[..., None, None])
+
+
+def saturation_times(mag, skylevel='dark', airmass=1., zp=None,
+        profile=Instrument.NGTS, dx=0., dy=0., psf=None,
+        halfwidth=DefaultHalfwidth, limit=None):
+    '''
+    Exposure time at which each pixel of the footprint reaches `limit`
+    electrons (the full well depth by default), with the footprint as the
+    last two axes. Pixels which the bias alone fills return 0.
+    '''
+    profile = Instrument.get_profile(profile)
+    if limit is None:
+        limit = profile.full_well_depth
+    rates = _rates(mag, skylevel, airmass, zp, profile, dx, dy, psf,
+            halfwidth)
+    return _times(rates, limit, profile.bias_level)
+
+
+def _times(rates, limit, bias):
+    return np.maximum((limit - bias) / rates, 0.)
+
+
+def _count_saturated(fractions, critical):
+    # Pixels whose fraction reaches the critical fraction. With one
+    # footprint for every star the sorted fractions are searched once,
+    # otherwise the pixels are counted one at a time so the footprint is
+    # never broadcast against the exposure times.
+    fractions = fractions.reshape(fractions.shape[:-2] + (-1,))
+    if fractions.ndim == 1:
+        return fractions.size - np.searchsorted(np.sort(fractions), critical,
+                side='left')
+    count = 0
+    for i in range(fractions.shape[-1]):
+        count = count + (fractions[..., i] >= critical)
+    return np.asarray(count)
+
+
+def footprint_saturation(mag, exptime, skylevel='dark', airmass=1., zp=None,
+        profile=Instrument.NGTS, dx=0., dy=0., psf=None,
+        halfwidth=DefaultHalfwidth):
+    '''
+    Full well and ADC saturation of every star at every exposure time,
+    e.g. for `mag[:, None]` and `exptime[None, :]`; see
+    `FootprintSaturation`. The arguments are those of
+    `footprint_electrons`.
+
+    A pixel reaches `limit` electrons when its fraction of the psf is at
+    least ((limit - bias) / exptime - sky) / source, so the pixels are
+    counted by comparing their fractions to this critical fraction.
+    '''
+    profile = Instrument.get_profile(profile)
+    exptime = np.asarray(exptime, dtype=float)
+    source, fractions, sky = _footprint(mag, skylevel, airmass, zp, profile,
+            dx, dy, psf, halfwidth)
+
+    def critical(limit):
+        with np.errstate(divide='ignore'):
+            return ((limit - profile.bias_level) / exptime - sky) / source
+
+    nfull_well = _count_saturated(fractions, critical(profile.full_well_depth))
+    nadc = _count_saturated(fractions, critical(adc_limit(profile)))
+
+    peak = profile.bias_level + (source * fractions.max(axis=(-2, -1)) +
+            sky) * exptime
+    return FootprintSaturation(peak, nfull_well > 0, nadc > 0, nfull_well,
+            nadc)
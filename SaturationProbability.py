@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+
+'''
+Probability of saturation from the distribution of psf offsets
+
+The saturation limits in `fits.py` and `ErrorContributions` use a single
+central pixel fraction, but a star's psf centre can fall anywhere in the
+pixel, and whether it saturates depends on where. With central pixel
+fraction f a star saturates within `exptime` once
+
+    f (bias + (source + sky) exptime) >= full well depth
+
+(the model of `ErrorContributions.saturation_time`). `SaturationProbability`
+tabulates the distribution of f for psf centres spread uniformly over the
+pixel, the distribution `OffsetDistribution.py` samples, so the
+probability of saturation is the chance that f exceeds the critical
+fraction, read from the table for every star and exposure time at once.
+
+Stars saturate independently, so the expected number of saturated stars
+is the sum of their probabilities with variance sum p (1 - p), from which
+the confidence bands are drawn (a normal approximation).
+'''
+
+from collections import namedtuple
+import numpy as np
+from scipy.special import ndtri
+import Instrument
+import PSFFraction
+from MagnitudeIndex import as_index
+
+# Psf offsets per axis, over a quadrant of the pixel (the fractions are
+# symmetric), and nodes in the tabulated distribution
+DefaultSamples = 256
+DefaultNodes = 4096
+
+SaturationCounts = namedtuple('SaturationCounts', ['expected', 'low', 'high'])
+
+
+def central_fractions(fwhm, psf=None, nsamples=DefaultSamples):
+    '''
+    Central pixel fractions for psf centres on a regular grid over the
+    pixel, for a Gaussian of `fwhm` or a `PSF.PSF`
+    '''
+    offsets = (np.arange(nsamples) + 0.5) * 0.5 / nsamples
+    if psf is not None:
+        fractions = psf.central_fraction(offsets[:, None], offsets[None, :])
+    else:
+        fractions = PSFFraction.central_fraction(fwhm, offsets[:, None],
+                offsets[None, :])
+    return fractions.ravel()
+
+
+class SaturationProbability(object):
+    '''
+    Saturation probability for stars observed with `profile` under the
+    given sky (a value, or "dark"/"bright") and airmass. `zp` defaults to
+    that of the saturation functions in `ErrorContributions`, and the psf
+    to a Gaussian of the profile's fwhm.
+    '''
+    def __init__(self, profile=Instrument.NGTS, skylevel='dark', airmass=1.,
+            zp=None, psf=None, nsamples=DefaultSamples, nodes=DefaultNodes):
+        super(SaturationProbability, self).__init__()
+        if zp is None:
+            from ErrorContributions import ZP
+            zp = ZP(1.)
+        self.profile = Instrument.get_profile(profile)
+        self.zp = zp - self.profile.extinction * airmass
+        self.sky = Instrument.sky_level(self.profile, skylevel) * self.profile.area
+        self.bias = self.profile.bias_level * self.profile.area
+
+        # Chance that the fraction is at least each node value
+        fractions = np.sort(central_fractions(self.profile.fwhm, psf,
+            nsamples))
+        self.fractions = np.linspace(fractions[0], fractions[-1], nodes)
+        self.survival = 1. - np.searchsorted(fractions, self.fractions,
+                side='left') / float(fractions.size)
+
+    def critical_fraction(self, mag, exptime):
+        '''
+        Central pixel fraction above which the star saturates
+        '''
+        rate = 10 ** ((self.zp - np.asarray(mag, dtype=float)) / 2.5) + self.sky
+        return self.profile.full_well_depth / (self.bias + rate *
+                np.asarray(exptime, dtype=float))
+
+    def __call__(self, mag, exptime):
+        '''
+        Probability that each star saturates, for (broadcast) magnitudes
+        and exposure times
+        '''
+        return np.interp(self.critical_fraction(mag, exptime),
+                self.fractions, self.survival, left=1., right=0.)
+
+    def magnitude(self, fraction, exptime):
+        '''
+        Magnitude whose critical fraction is `fraction`, which is inf if
+        the sky and bias alone reach it
+        '''
+        source = ((self.profile.full_well_depth / fraction - self.bias) /
+                np.asarray(exptime, dtype=float) - self.sky)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(source > 0, self.zp - 2.5 * np.log10(source),
+                    np.inf)
+
+    def expected_counts(self, mags, exptimes):
+        '''
+        Expected number of saturated stars among `mags` (an array or a
+        `MagnitudeIndex`) at each exposure time, and its variance
+        '''
+        mags = as_index(mags).mags
+        exptimes = np.asarray(exptimes, dtype=float).ravel()
+
+        # Stars brighter than the limit for the smallest fraction always
+        # saturate, and fainter than that for the largest never do, so
+        # only the stars in between are evaluated
+        always = np.searchsorted(mags, self.magnitude(self.fractions[0],
+            exptimes), side='right')
+        never = np.searchsorted(mags, self.magnitude(self.fractions[-1],
+            exptimes), side='left')
+
+        expected = np.zeros(exptimes.size)
+        variance = np.zeros(exptimes.size)
+        for i, exptime in enumerate(exptimes):
+            probability = self(mags[always[i]:never[i]], exptime)
+            expected[i] = always[i] + probability.sum()
+            variance[i] = (probability * (1. - probability)).sum()
+        return expected, variance
+
+    def counts(self, mags, exptimes, confidence=0.95):
+        '''
+        Expected number of saturated stars at each exposure time, with the
+        two sided `confidence` band
+        '''
+        index = as_index(mags)
+        expected, variance = self.expected_counts(index, exptimes)
+        width = ndtri(0.5 + confidence / 2.) * np.sqrt(variance)
+        return SaturationCounts(expected, np.maximum(expected - width, 0.),
+                np.minimum(expected + width, index.size))
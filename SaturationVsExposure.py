@@ -14,28 +14,29 @@ on disk for usage later.
 '''
 
 import argparse
+import logging
 import numpy as np
-import os.path
 import pickle
-import subprocess
-import progressbar
-import re
-import tempfile
 from functools import partial
 import tables
+import Instrument
+from Config import SkyLevel
+import ErrorContributions
+from ErrorContributions import saturation_time
+from Sweep import SweepExecutor
+from ResultStore import ResultStore
 
-def get_error_contrib(magnitude, skytype):
-    tfile = tempfile.NamedTemporaryFile()
-    cmd = [os.path.join(os.path.dirname(__file__),
-                        "ErrorContributions.py"),
-            '-m', str(magnitude), "-o", tfile.name,
-            "-s", skytype,
-            ]
+# Longest exposure time considered by ErrorContributions.py
+MaxExptime = 3600.
 
-    result = subprocess.check_output(cmd)
-    result = float(re.search(r"Saturation in (\d+\.*\d+) seconds", result).group(1))
 
-    return result
+def get_error_contrib(magnitude, skytype):
+    '''
+    Returns the time in seconds for a star of `magnitude` to saturate at
+    airmass 1 in the given sky, as reported by ErrorContributions.py
+    '''
+    return float(saturation_time(magnitude, SkyLevel[skytype], 1.,
+        max_exptime=MaxExptime))
 
 get_dark_contrib = partial(get_error_contrib, skytype='dark')
 get_bright_contrib = partial(get_error_contrib, skytype='bright')
@@ -44,21 +45,16 @@ get_bright_contrib = partial(get_error_contrib, skytype='bright')
 def GetData():
     MagRange = (8.25, 13, 0.25)
     mags = np.arange(*MagRange)
-    brighttimes, darktimes = [], []
-    pb = progressbar.ProgressBar(2. * mags.size).start()
-    counter = 1
-    for mag in mags:
-        result = get_bright_contrib(mag)
-        brighttimes.append(result)
-        pb.update(counter)
-        counter += 1
-
-    for mag in mags:
-        result = get_dark_contrib(mag)
-        darktimes.append(result)
-
-        pb.update(counter)
-        counter += 1
+
+    # Each point is a closed form calculation so a process pool
+    # costs more than it saves
+    executor = SweepExecutor(processes=1)
+    store = ResultStore('SaturationVsExposure', [Instrument.NGTS.cache_key(),
+        ErrorContributions.CentralPixelFraction, ErrorContributions.Extinction,
+        ErrorContributions.ZP(1.), MaxExptime])
+    grid = [(mag, skytype) for skytype in ['bright', 'dark'] for mag in mags]
+    results = np.array(executor.starmap(get_error_contrib, grid, store=store))
+    brighttimes, darktimes = results[:mags.size], results[mags.size:]
 
     return mags, np.log10(brighttimes), np.log10(darktimes)
 
@@ -102,19 +98,20 @@ class App(object):
         self.darkFit = np.poly1d(np.polyfit(self.darkxdata, self.ydata, 2))
 
 
-    def __del__(self):
+    def dumpFits(self):
         '''
-        Destructor, dumps the data and closes the plot when the class
-        is destroyed
+        Dumps the fits to the pickle output file
         '''
         pickle.dump({'bright': self.brightFit, 'dark': self.darkFit}, 
-                open(self.args.pickleout, "w"), protocol=2)
+                open(self.args.pickleout, "wb"), protocol=2)
 
     def run(self):
         '''
         Main function - sets up the plot nicely
         and plots points, lines and legend
         '''
+        self.dumpFits()
+
         # pgenv(0.9*self.brightxdata.min(), 1.1*self.brightxdata.max(), 0.9*self.ydata.min(), 1.1*self.ydata.max(), 0, 10)
         # pgpt(self.brightxdata, self.ydata, 6)
         # pgpt(self.darkxdata, self.ydata[:self.darkxdata.size], 7)
@@ -143,6 +140,7 @@ class App(object):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
     parser = argparse.ArgumentParser()
     parser.add_argument("-p", "--pickleout", help="Pickle output file name",
             default="fits.cpickle", required=False)
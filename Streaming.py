@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+
+'''
+Constant memory accumulators for Monte Carlo outputs
+
+Samples are added in batches with `update` and never stored, so a run of
+any length uses the same memory. Accumulators of the same shape can be
+combined with `merge`, e.g. the partial results of worker processes, and
+merging gives the same result as adding every batch to one accumulator.
+
+`RunningMoments` keeps the count, mean and sum of squared deviations,
+combined with the pairwise update of Chan et al., which is stable for
+long runs. `StreamingHistogram` counts samples in fixed, uniform bins,
+and estimates quantiles by interpolating its cumulative counts, so with
+fine bins the error of a quantile is a small fraction of the bin width.
+`StreamingSummary` combines the two.
+
+nan samples are left out of every statistic, and counted in `nan`.
+'''
+
+import numpy as np
+
+
+class RunningMoments(object):
+    def __init__(self):
+        super(RunningMoments, self).__init__()
+        self.count = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.min = np.inf
+        self.max = -np.inf
+        self.nan = 0
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        missing = np.isnan(values)
+        if missing.any():
+            self.nan += int(missing.sum())
+            values = values[~missing]
+        if not values.size:
+            return self
+
+        batch = RunningMoments()
+        batch.count = values.size
+        batch.mean = values.mean()
+        batch.m2 = ((values - batch.mean) ** 2).sum()
+        batch.min = values.min()
+        batch.max = values.max()
+        return self.merge(batch)
+
+    def merge(self, other):
+        self.nan += other.nan
+        if not other.count:
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / float(count)
+        self.m2 += other.m2 + delta ** 2 * self.count * other.count / float(
+                count)
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def variance(self):
+        '''
+        Population variance, as `numpy.var`
+        '''
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+class StreamingHistogram(object):
+    '''
+    Counts in `bins` uniform bins over `range`, with the samples below
+    and above the range counted separately. nan samples are only counted
+    in `nan`, and are not part of the `total`.
+    '''
+    def __init__(self, bins, range):
+        super(StreamingHistogram, self).__init__()
+        self.bins = int(bins)
+        self.range = (float(range[0]), float(range[1]))
+        if self.range[1] <= self.range[0]:
+            raise ValueError("Histogram range must be increasing")
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+        self.underflow = 0
+        self.overflow = 0
+        self.nan = 0
+
+    @property
+    def edges(self):
+        return np.linspace(self.range[0], self.range[1], self.bins + 1)
+
+    @property
+    def total(self):
+        return int(self.counts.sum()) + self.underflow + self.overflow
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float).ravel()
+        missing = np.isnan(values)
+        if missing.any():
+            self.nan += int(missing.sum())
+            values = values[~missing]
+        low, high = self.range
+        below = values < low
+        above = values > high
+        self.underflow += int(below.sum())
+        self.overflow += int(above.sum())
+
+        inside = values[~(below | above)]
+        index = ((inside - low) * (self.bins / (high - low))).astype(np.int64)
+        # The upper edge belongs to the last bin, as in `numpy.histogram`
+        np.minimum(index, self.bins - 1, out=index)
+        self.counts += np.bincount(index, minlength=self.bins)
+        return self
+
+    def merge(self, other):
+        if other.bins != self.bins or other.range != self.range:
+            raise ValueError("Only histograms with the same bins can be "
+                    "merged")
+        self.counts += other.counts
+        self.underflow += other.underflow
+        self.overflow += other.overflow
+        self.nan += other.nan
+        return self
+
+    def normalised(self):
+        '''
+        Fraction of all samples in each bin
+        '''
+        return self.counts / float(max(self.total, 1))
+
+    def quantile(self, q):
+        '''
+        Quantiles `q`, interpolated linearly within the bins. Quantiles
+        which fall among the samples outside the range are nan.
+        '''
+        q = np.asarray(q, dtype=float)
+        cumulative = np.concatenate([[self.underflow],
+            self.underflow + np.cumsum(self.counts)]).astype(float)
+        target = q * self.total
+
+        # First edge at which the cumulative count reaches the target
+        index = np.clip(np.searchsorted(cumulative, target, side='left'), 1,
+                self.bins)
+        low, high = cumulative[index - 1], cumulative[index]
+        weight = np.where(high > low, (target - low) / np.maximum(high - low,
+            1.), 0.)
+        edges = self.edges
+        result = edges[index - 1] + np.clip(weight, 0., 1.) * (
+                edges[index] - edges[index - 1])
+
+        outside = (target < self.underflow) | (
+                target > self.total - self.overflow)
+        return np.where(outside | (self.total == 0), np.nan, result)
+
+
+class StreamingSummary(object):
+    '''
+    Moments and a fine histogram over `range` for quantiles
+    '''
+    def __init__(self, range, bins=2 ** 16):
+        super(StreamingSummary, self).__init__()
+        self.moments = RunningMoments()
+        self.histogram = StreamingHistogram(bins, range)
+
+    @property
+    def count(self):
+        return self.moments.count
+
+    @property
+    def mean(self):
+        return self.moments.mean
+
+    @property
+    def std(self):
+        return self.moments.std
+
+    @property
+    def nan(self):
+        return self.moments.nan
+
+    def update(self, values):
+        self.moments.update(values)
+        self.histogram.update(values)
+        return self
+
+    def merge(self, other):
+        self.moments.merge(other.moments)
+        self.histogram.merge(other.histogram)
+        return self
+
+    def quantile(self, q):
+        return self.histogram.quantile(q)
+
+    def median(self):
+        return float(self.quantile(0.5))
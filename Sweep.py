@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+'''
+Parallel parameter sweeps
+
+`SweepExecutor` evaluates a function over a grid of parameters by fanning
+chunks of the grid out over a process pool. Results are returned in the
+order of the grid and progress is reported with a progress bar. Given a
+`ResultStore.ResultStore`, each result is stored as soon as its chunk
+completes, so a restarted sweep only computes the points it is missing.
+
+The pool is started by the first sweep and reused by the later ones, so
+repeated sweeps do not each pay for starting the workers. Close it with
+`close()`, or use the executor as a context manager:
+
+    with SweepExecutor() as executor:
+        results = executor.map(function, grid)
+'''
+
+import itertools
+import multiprocessing
+from functools import partial
+import progressbar
+
+
+def parameter_grid(**axes):
+    '''
+    Returns the outer product of the given axes as a list of
+    dictionaries, e.g.
+
+        parameter_grid(mag=[10, 11], skytype=['dark', 'bright'])
+    '''
+    names = sorted(axes)
+    return [dict(zip(names, values)) for values in
+            itertools.product(*[axes[name] for name in names])]
+
+
+def _run_chunk(function, star, chunk):
+    if star:
+        return [(index, function(*item)) for (index, item) in chunk]
+    return [(index, function(item)) for (index, item) in chunk]
+
+
+class SweepExecutor(object):
+    '''
+    Evaluates a function over a parameter grid with a process pool
+
+    `processes` defaults to the number of cores, and 1 evaluates in this
+    process without a pool. `chunksize` defaults to splitting the grid
+    into roughly four chunks per process. `function` must be importable
+    (i.e. defined at module level) so it can be sent to the workers.
+    '''
+    def __init__(self, processes=None, chunksize=None, progress=True):
+        super(SweepExecutor, self).__init__()
+        self.processes = processes or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+        self.progress = progress
+        self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _get_pool(self):
+        if self.processes > 1 and self.pool is None:
+            self.pool = multiprocessing.Pool(self.processes)
+        return self.pool
+
+    def close(self):
+        '''
+        Waits for the workers to finish and stops them. A later sweep
+        starts a new pool.
+        '''
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def terminate(self):
+        '''
+        Stops the workers without waiting for them
+        '''
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def map(self, function, grid, store=None):
+        '''
+        Returns [function(item) for item in grid]
+
+        If a `ResultStore.ResultStore` is given, items already in the
+        store are not recomputed and new results are added to it as
+        they complete.
+        '''
+        return self._map(function, grid, False, store)
+
+    def starmap(self, function, grid, store=None):
+        '''
+        Returns [function(*item) for item in grid]
+        '''
+        return self._map(function, grid, True, store)
+
+    def _chunks(self, indexed):
+        chunksize = self.chunksize or max(1,
+                len(indexed) // (4 * self.processes))
+        return [indexed[i:i + chunksize] for i in
+                range(0, len(indexed), chunksize)]
+
+    def _map(self, function, grid, star, store):
+        grid = list(grid)
+        results = [None] * len(grid)
+
+        pending = []
+        for index, item in enumerate(grid):
+            if store is not None and item in store:
+                results[index] = store.get(item)
+            else:
+                pending.append((index, item))
+
+        chunks = self._chunks(pending)
+        worker = partial(_run_chunk, function, star)
+
+        if self.progress:
+            pb = progressbar.ProgressBar(len(grid)).start()
+
+        ncomplete = len(grid) - len(pending)
+        pool = self._get_pool()
+        try:
+            completed = (pool.imap_unordered(worker, chunks) if pool
+                    else map(worker, chunks))
+            for chunk_results in completed:
+                for (index, result) in chunk_results:
+                    results[index] = result
+                    if store is not None:
+                        store.put(grid[index], result)
+
+                ncomplete += len(chunk_results)
+                if self.progress:
+                    pb.update(ncomplete)
+        except:
+            # The workers may still be running the abandoned chunks
+            self.terminate()
+            raise
+
+        if self.progress:
+            pb.finish()
+
+        return results
@@ -5,22 +5,47 @@ import os
 import os.path
 import argparse
 #from subprocess import Popen, call, PIPE, STDOUT
-import matplotlib.pyplot as plt
 import numpy as np
 #import pyfits
 import logging
-import AstErrors as ae
 import pickle
-import tables
-from Config import *
+from Config import ReadNoise, SkyLevel
 import csv
+from collections import namedtuple
 from fits import Fits
-
-plt.rc('text', usetex=True)
-plt.rc('figure', figsize=(8.3, 5.8))  # A5
+import NoiseModel
+import Instrument
+import JitterNoise
+from NoiseCache import default_cache
 
 logger = logging.getLogger('TheoryNoise')
 
+PrecisionStats = namedtuple('PrecisionStats',
+        ['crosspoint', 'darklimit', 'brightlimit'])
+
+
+def precision_stats(exptime, totaltime=3600., airmass=1.3, skylevel='dark',
+        darklevel=0.6, scintillation_method='osborn', target=1E-3,
+        profile=Instrument.NGTS, jitter_rms=None):
+    '''
+    Returns the magnitude at which the `target` precision is reached and the
+    dark and bright time saturation limits, for a single exposure time or
+    an array of them.
+
+    This is the in process equivalent of the CROSSPOINT, DARK and BRIGHT
+    values printed by running the script with `-v`. The crossing point is
+    for `profile`, an `Instrument.InstrumentProfile`; the saturation limits
+    are the NGTS fits. `jitter_rms` defaults to the profile's.
+    '''
+    crosspoint = default_cache().call(NoiseModel.profile_crosspoint,
+            profile, target, exptime, airmass, skylevel, totaltime, darklevel,
+            scintillation_method, jitter_rms)
+
+    fits = Fits()
+    logexptime = np.log10(exptime)
+    return PrecisionStats(crosspoint, fits['dark'](logexptime),
+            fits['bright'](logexptime))
+
 class FileRender(object):
     def __init__(self, out_filename):
         self.filename = out_filename
@@ -58,12 +83,6 @@ class App(object):
     '''
     Main application object for the project
     '''
-    source = []
-    sky = []
-    read = []
-    scin = []
-    total = []
-    dark = []
     def __init__(self, args):
         '''
         Constructor
@@ -105,6 +124,8 @@ class App(object):
 
 
     def saturationLimit(self, group):
+        import matplotlib.pyplot as plt
+
         fits = Fits()
         self.brightLimit = fits['bright'](np.log10(self.exptime))
         self.darkLimit = fits['dark'](np.log10(self.exptime))
@@ -117,21 +138,40 @@ class App(object):
         plt.axvline(self.darkLimit, color='k', ls='--')
 
 
+    def noiseFromCube(self, airmass, skypersecperpix, targettime,
+            **parameters):
+        '''
+        Interpolates the noise contributions out of a precomputed
+        noise cube rather than evaluating the model, refusing a cube
+        not built with the model `parameters` (see `NoiseCube.check`)
+        '''
+        from NoiseCube import NoiseCube
+
+        with NoiseCube(self.args.from_cube) as cube:
+            cube.check(**parameters)
+            logger.info('Reading noise cube {} ({} scintillation, '
+                    'dark level {:f})'.format(self.args.from_cube,
+                        cube.scintillation_method, cube.parameters['darklevel']))
+            return cube.contributions(mag=self.mag, exptime=self.exptime,
+                    airmass=airmass, sky=skypersecperpix, bintime=targettime)
+
     def run(self):
         '''
         Main function
         '''
-        radius = 3. # Radius of flux extraction aperture
-        npix = np.pi * radius ** 2
-        detector = ae.NGTSDetector()
-        extinction = 0.06
+        # Imported here so precision_stats can be used without them
+        import matplotlib.pyplot as plt
+        import tables
+
+        npix = NoiseModel.NGTSParameters['npix']
+        extinction = NoiseModel.NGTSParameters['extinction']
         targettime = self.args.totaltime
-        height = 2400.
-        apsize = 0.2
+        height = NoiseModel.NGTSParameters['height']
+        apsize = NoiseModel.NGTSParameters['apsize']
         airmass = self.args.airmass
         readnoise = ReadNoise
         # zp = srw.ZP(1.)
-        zp = 21.1
+        zp = NoiseModel.NGTSParameters['zp']
 
         logger.info('Airmass: {:f}'.format(airmass))
         logger.info('Read noise: {:f}'.format(readnoise))
@@ -147,28 +187,36 @@ class App(object):
 
 
         dark_level = self.args.darklevel
-        for mag in self.mag:
-            errob = ae.ErrorContribution(mag, npix, detector.readTime(),
-                    extinction, targettime, height, apsize, zp, readnoise)
-            self.source.append(errob.sourceError(airmass, self.exptime))
-            self.sky.append(errob.skyError(airmass, self.exptime,
-                skypersecperpix))
-            self.read.append(errob.readError(airmass, self.exptime))
-            self.scin.append(errob.scintillationError(airmass, self.exptime, method=args.scintillation_method))
-            self.dark.append(errob.darkError(airmass, self.exptime, dark_level))
-            self.total.append(errob.totalError(airmass, self.exptime,
-                skypersecperpix, dark_level, scintillation_method=args.scintillation_method))
-
+        jitter = JitterNoise.profile_jitter_noise(Instrument.NGTS,
+                self.exptime, self.args.jitter)
+        logger.info('Jitter noise per exposure: {:e}'.format(float(jitter)))
+        readtime = Instrument.NGTS.read_time
+        if self.args.from_cube:
+            noise = self.noiseFromCube(airmass, skypersecperpix, targettime,
+                    npix=npix, readtime=readtime, extinction=extinction,
+                    height=height, apsize=apsize, zp=zp, readnoise=readnoise,
+                    darklevel=dark_level,
+                    scintillation_method=self.args.scintillation_method,
+                    jitter_rms=(Instrument.NGTS.jitter_rms
+                        if self.args.jitter is None else self.args.jitter))
+        else:
+            noise = default_cache().call(NoiseModel.noise_contributions,
+                    self.mag, self.exptime, airmass, skypersecperpix, npix,
+                    readtime, extinction, targettime, height, apsize, zp,
+                    readnoise, dark_level,
+                    scintillation_method=self.args.scintillation_method,
+                    jitter=jitter)
         self.source, self.sky, self.read, self.scin, self.total, self.dark = [
-                np.array(d) for d in [self.source, self.sky, self.read, self.scin,
-                    self.total, self.dark]]
+                noise.source, noise.sky, noise.read, noise.scintillation,
+                noise.total, noise.dark]
+        self.jitter = noise.jitter
 
 
         if self.args.plotwasp: self.plotWASPData()
         if self.args.plotngts: self.plotNGTSData()
 
-        if args.render:
-            fr = FileRender(args.render)
+        if self.args.render:
+            fr = FileRender(self.args.render)
         else:
             fr = NullFileRender()
 
@@ -179,9 +227,11 @@ class App(object):
         # Plot the theory lines
         fr.add_dataset('Magnitude', self.mag)
         for (colour, ydata, label) in zip(
-                ['r', 'b', 'g', 'c', 'm', 'k'],
-                [self.source, self.sky, self.read, self.scin, self.total, self.dark],
-                ['Source', 'Sky', 'Read', 'Scintillation', 'Total', 'Dark']
+                ['r', 'b', 'g', 'c', 'm', 'k', 'y'],
+                [self.source, self.sky, self.read, self.scin, self.total, self.dark,
+                    self.jitter],
+                ['Source', 'Sky', 'Read', 'Scintillation', 'Total', 'Dark',
+                    'Jitter']
                 ):
             plt.plot(self.mag, ydata, color=colour, ls='-', label=label)
             fr.add_dataset(label, ydata)
@@ -190,25 +240,35 @@ class App(object):
         if self.args.satlimit: self.saturationLimit(group)
         fr.render()
 
-        # Draw the 1mmag line
-        plt.axhline(1E-3, color='k', ls=':', zorder=-10)
+        # Draw the target precision (1mmag by default) line
+        target = self.args.precision_target
+        plt.axhline(target, color='k', ls=':', zorder=-10)
 
         # Plot a line at the point when the total error meets
-        # the 1mmag line
-        distFrom1mmag = np.abs(self.total - 1E-3)
-        ind = distFrom1mmag==distFrom1mmag.min()
-        self.crossPoint = self.mag[ind][0]
+        # the target precision line
+        if self.args.from_cube:
+            # The total error is monotonic in magnitude, so interpolate
+            # the crossing point from the cube slice
+            self.crossPoint = np.interp(np.log10(target),
+                    np.log10(self.total), self.mag)
+        else:
+            self.crossPoint = float(default_cache().call(
+                NoiseModel.crosspoint, target, self.exptime, airmass,
+                skypersecperpix, npix, readtime, extinction, targettime,
+                height, apsize, zp, readnoise, dark_level,
+                scintillation_method=self.args.scintillation_method,
+                jitter=jitter))
         plt.axvline(self.crossPoint, color='k', ls=':', zorder=-10)
 
         group._v_attrs.crosspoint = self.crossPoint
 
         plt.xlabel(r'I magnitude')
         plt.ylabel(r'Fractional error')
-        if not args.notitle:
+        if not self.args.notitle:
             plt.title(r"$t_e$: %.1f s, "
                         "$t_I$: %.1f hours, "
-                        "1mmag @ %.3f mag" % (self.exptime, targettime/3600.,
-                            self.crossPoint))
+                        "%gmmag @ %.3f mag" % (self.exptime, targettime/3600.,
+                            target * 1E3, self.crossPoint))
 
         plt.legend(loc='best')
         plt.yscale('log')
@@ -234,6 +294,11 @@ class App(object):
 
 
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    import matplotlib.pyplot as plt
+    plt.rc('text', usetex=True)
+    plt.rc('figure', figsize=(8.3, 5.8))  # A5
+
     import warnings
     with warnings.catch_warnings():
         warnings.filterwarnings("ignore", r'.*use PyArray_AsCArray.*')
@@ -267,6 +332,15 @@ if __name__ == '__main__':
                     required=False)
             parser.add_argument('--scintillation-method', required=False, choices={'young', 'osborn'},
                     help="Choose between Young's scintillation method, and Osborn's (default) scintillation method'", default='osborn')
+            parser.add_argument('--from-cube', required=False, metavar='FILE',
+                    help='Read the noise contributions from a noise cube built '
+                    'with NoiseCube.py instead of evaluating the model')
+            parser.add_argument('-p', '--precision-target', help='Fractional '
+                    'precision to find the crossing magnitude for (default 1mmag)',
+                    default=1E-3, type=float, required=False)
+            parser.add_argument('--jitter', help='Pointing jitter rms per '
+                    'axis in pixels (default: the NGTS value, 0 until '
+                    'measured)', type=float, default=None, required=False)
             args = parser.parse_args()
             app = App(args)
         except KeyboardInterrupt:
@@ -12,11 +12,11 @@ import numpy as np
 import srw
 #import pyfits
 from ppgplot import *
-import AstErrors as ae
 import pickle
 from srw import pghelpers as pgh
-from ConfigWASP import *
 from fits import Fits
+import NoiseModel
+import Instrument
 
 COLOURS = {'sky': 4, 'source': 2, 'scin': 5, 'total': 1, 'read': 3}
 
@@ -25,12 +25,6 @@ class App(object):
     '''
     Main application object for the project
     '''
-    source = []
-    sky = []
-    read = []
-    scin = []
-    total = []
-
     def __init__(self, args):
         '''
         Constructor
@@ -96,39 +90,19 @@ class App(object):
         '''
         Main function
         '''
-        radius = 3.5  # Radius of flux extraction aperture
-        npix = np.pi * radius ** 2
-        detector = ae.WASPDetector()
-        extinction = 0.08
         targettime = self.args.totaltime
-        height = 2400.
-        apsize = 0.111
         airmass = 1.
-        readnoise = ReadNoise
-        #zp = srw.ZP(1.)
-        #zp = 15  # from RGW
-        zp = 18.545
-
-        if self.args.skylevel == "dark": skypersecperpix = 18.
-        elif self.args.skylevel == "bright": skypersecperpix = 18.
-
-
-        for mag in self.mag:
-            errob = ae.ErrorContribution(mag, npix, detector.readTime(),
-                    extinction, targettime, height, apsize, zp, readnoise)
-            self.source.append(errob.sourceError(airmass, self.exptime))
-            self.sky.append(errob.skyError(airmass, self.exptime,
-                skypersecperpix))
-            self.read.append(errob.readError(airmass, self.exptime))
-            self.scin.append(errob.scintillationError(airmass, self.exptime))
-            self.total.append(errob.totalError(airmass, self.exptime,
-                skypersecperpix))
-
-        self.source = np.log10(self.source)
-        self.sky = np.log10(self.sky)
-        self.read = np.log10(self.read)
-        self.scin = np.log10(self.scin)
-        self.total = np.log10(self.total)
+
+        # The aperture, site and zero point (and Young's scintillation)
+        # come from the WASP profile
+        noise = NoiseModel.profile_noise(Instrument.WASP, self.mag,
+                self.exptime, airmass, self.args.skylevel, targettime)
+
+        self.source = np.log10(noise.source)
+        self.sky = np.log10(noise.sky)
+        self.read = np.log10(noise.read)
+        self.scin = np.log10(noise.scintillation)
+        self.total = np.log10(noise.total)
 
         pgopen(self.args.device)
         pgvstd()
@@ -1,15 +1,167 @@
 #!/usr/bin/env python
 
-import json
+'''
+Saturation limits against exposure time
+
+`Fits()['dark']` and `Fits()['bright']` map log10 exposure time to the
+magnitude which saturates the central pixel, as given by
+`ErrorContributions.saturation_magnitude`. Each is a `SaturationLimits`
+table of the closed form on a dense, uniform grid of log exposure time,
+evaluated with a monotone cubic (Fritsch-Carlson) spline, so a lookup is
+a constant number of operations per star whatever the grid size. The
+spline interpolates the source flux at the limit, 10^(-0.4 m), which is
+smooth in log exposure time where the magnitude itself diverges.
+
+The tables are saved under `.satlimits/`, named by a hash of the profile,
+sky level, zero point, central pixel fraction and grid, so they are
+rebuilt automatically when any of these change.
+
+As the exposure time approaches the time at which the sky and bias alone
+fill the pixel, the limit grows without bound. The grid stops where it
+reaches `MagnitudeCeiling`, fainter than any catalogue star, and longer
+exposures return inf: every star saturates.
+'''
+
+import logging
+import os
+import tempfile
+import zipfile
 import numpy as np
+import Instrument
+from ResultStore import canonical_hash
 
+logger = logging.getLogger('fits')
 
-class Fits(object):
+DefaultPath = '.satlimits'
+
+# log10 exposure time range of the tables, and their number of nodes
+LogExptimeRange = (-1., np.log10(3600. * 24.))
+Nodes = 2048
+
+# Limits fainter than this are reported as inf
+MagnitudeCeiling = 25.
+
+
+def _slopes(values, step):
+    '''
+    Fritsch-Carlson derivatives of `values` on a uniform grid: the
+    harmonic mean of the neighbouring secants, or zero at a local
+    extremum, and the one sided secant at the ends
+    '''
+    secants = np.diff(values) / step
+    slopes = np.empty_like(values)
+    slopes[0], slopes[-1] = secants[0], secants[-1]
+
+    left, right = secants[:-1], secants[1:]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        harmonic = 2. * left * right / (left + right)
+    slopes[1:-1] = np.where(left * right > 0, harmonic, 0.)
+    return slopes
+
+
+def build_table(skylevel, airmass=1., zp=None, central_fraction=None,
+        profile=Instrument.NGTS, nodes=Nodes):
+    '''
+    Returns the table arrays of the source flux at the saturation limit,
+    10^(-0.4 m), and its spline slopes against log10 exposure time
+    '''
+    from ErrorContributions import saturation_magnitude, saturation_time
+    sky = Instrument.sky_level(profile, skylevel)
 
-    def __init__(self):
-        self.dark_fit = np.poly1d([-0.24445729,  3.48611203,  6.34602232])
-        self.bright_fit = np.poly1d([-4.7810172,  27.96839962, -56.36501281,
-                                     50.95593997,  -7.84970971])
+    # The grid ends where the limit reaches the ceiling
+    longest = float(saturation_time(MagnitudeCeiling, sky, airmass, zp,
+        central_fraction, profile=profile))
+    high = min(LogExptimeRange[1], np.log10(longest))
+    logexptime = np.linspace(LogExptimeRange[0], high, nodes)
+
+    flux = 10 ** (-0.4 * saturation_magnitude(10 ** logexptime, sky,
+        airmass, zp, central_fraction, profile))
+    step = logexptime[1] - logexptime[0]
+    return {'logexptime': logexptime, 'flux': flux,
+            'slopes': _slopes(flux, step),
+            'ceiling': np.array(high < LogExptimeRange[1])}
+
+
+class SaturationLimits(object):
+    '''
+    Saturation magnitude against log10 exposure time for one sky level
+    ("dark", "bright" or a value), loaded from `path` or built if missing
+    '''
+    def __init__(self, skylevel, airmass=1., zp=None, central_fraction=None,
+            profile=Instrument.NGTS, path=DefaultPath, nodes=Nodes):
+        super(SaturationLimits, self).__init__()
+        from ErrorContributions import ZP, CentralPixelFraction
+        profile = Instrument.get_profile(profile)
+        if zp is None:
+            zp = ZP(1.)
+        if central_fraction is None:
+            central_fraction = CentralPixelFraction
+
+        self.key = canonical_hash(profile, Instrument.sky_level(profile,
+            skylevel), airmass, zp, central_fraction, LogExptimeRange,
+            nodes, MagnitudeCeiling)
+        self.filename = os.path.join(path, 'limits-{}.npz'.format(self.key))
+
+        try:
+            with np.load(self.filename) as infile:
+                data = dict(infile)
+        except (IOError, ValueError, zipfile.BadZipFile):
+            logger.info('Building saturation limit table {}'.format(
+                self.filename))
+            data = build_table(skylevel, airmass, zp, central_fraction,
+                    profile, nodes)
+            self._save(path, data)
+
+        self.logexptime = data['logexptime']
+        self.flux = data['flux']
+        self.slopes = data['slopes']
+        self.ceiling = bool(data['ceiling'])
+        self.step = self.logexptime[1] - self.logexptime[0]
+
+    def _save(self, path, data):
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        handle, tmpname = tempfile.mkstemp(dir=path, suffix='.npz')
+        with os.fdopen(handle, 'wb') as outfile:
+            np.savez(outfile, **data)
+        os.rename(tmpname, self.filename)
+
+    def __call__(self, logexptime):
+        '''
+        Saturation magnitude at each log10 exposure time
+        '''
+        logexptime = np.asarray(logexptime, dtype=float)
+        low, high = self.logexptime[0], self.logexptime[-1]
+        tolerance = 1E-9 * (high - low)
+        beyond = logexptime > high + tolerance
+        if (logexptime < low - tolerance).any() or (
+                beyond.any() and not self.ceiling):
+            raise ValueError("Exposure times outside of the table range "
+                    "{:g} - {:g} s".format(10 ** low, 10 ** high))
+
+        # Cubic Hermite interpolation within the node interval
+        position = (np.clip(logexptime, low, high) - low) / self.step
+        index = np.clip(np.floor(position).astype(int), 0,
+                self.logexptime.size - 2)
+        u = position - index
+        h00 = (1. + 2. * u) * (1. - u) ** 2
+        h10 = u * (1. - u) ** 2
+        h01 = u ** 2 * (3. - 2. * u)
+        h11 = u ** 2 * (u - 1.)
+        flux = (h00 * self.flux[index] + h01 * self.flux[index + 1] +
+                self.step * (h10 * self.slopes[index] +
+                    h11 * self.slopes[index + 1]))
+        return np.where(beyond, np.inf, -2.5 * np.log10(flux))
+
+
+class Fits(object):
+    '''
+    The NGTS saturation limits for dark and bright time at airmass 1
+    '''
+    def __init__(self, profile=Instrument.NGTS, path=DefaultPath):
+        self.dark_fit = SaturationLimits('dark', profile=profile, path=path)
+        self.bright_fit = SaturationLimits('bright', profile=profile,
+                path=path)
         self._mapping = {
             'dark': self.dark_fit,
             'bright': self.bright_fit,